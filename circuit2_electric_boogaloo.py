@@ -5,11 +5,17 @@
 CIRCUIT = 1
 
 # Gate types
-INP, ADD, MUL = (0,1,2)
+INP, ADD, MUL, CMUL, CADD, DOT = (0,1,2,3,4,5)
 
 # Define MPC Function as an addition/multiplication circuit. INPut gates 
 # precede ADD/MUL gates. ADD/MUL gates are defined in evaluation order. 
 # By convention the final wire is considerd the circuit's output wire.
+# CMUL/CADD gates multiply/add their single input (order 1) by a public 
+# constant given as a 4th element, e.g. (CMUL, 12, 2, 64), and need no
+# communication.
+# ADD gates add any number of inputs (orders 1, 2, 3, ...). DOT gates 
+# compute the inner product of their input pairs (orders 1&2, 3&4, ...) and 
+# need a single degree reduction, however many pairs they have.
 
 if CIRCUIT == 1: 	# example in Smart
   # ___________________________________________________________________________
@@ -23,18 +29,29 @@ if CIRCUIT == 1: 	# example in Smart
   def function(x):	# function being evaluated by parties
     return (x[1]*x[2] + x[3]*x[4] + x[5]*x[6]) % PRIME
 
+  # As in Smart, with a MUL gate per product
+  # GATES = {
+  #   1:  (INP, 7, 1),
+  #   2:  (INP, 7, 2),
+  #   3:  (INP, 8, 1),
+  #   4:  (INP, 8, 2),
+  #   5:  (INP, 9, 1),
+  #   6:  (INP, 9, 2),
+  #   7:  (MUL, 10, 1),
+  #   8:  (MUL, 10, 2),
+  #   9:  (MUL, 11, 1),
+  #   10: (ADD, 11, 2),
+  #   11: (ADD, 12, 1),  	# (12,1) is circuit output wire
+  # }
+
   GATES = {
     1:  (INP, 7, 1),
     2:  (INP, 7, 2),
-    3:  (INP, 8, 1),
-    4:  (INP, 8, 2),
-    5:  (INP, 9, 1),
-    6:  (INP, 9, 2),
-    7:  (MUL, 10, 1),
-    8:  (MUL, 10, 2),
-    9:  (MUL, 11, 1),
-    10: (ADD, 11, 2),
-    11: (ADD, 12, 1),  	# (12,1) is circuit output wire
+    3:  (INP, 7, 3),
+    4:  (INP, 7, 4),
+    5:  (INP, 7, 5),
+    6:  (INP, 7, 6),
+    7:  (DOT, 8, 1),  	# (8,1) is circuit output wire
   }
 
 elif CIRCUIT == 2:	# factorial tree for 2^n parties
@@ -83,21 +100,23 @@ elif CIRCUIT == 3:	# Binary to decimal converter
   # Binary number to be converted, as an array of digits (order unchanged)
   # Note - for large inputs, ensure MAX_TIME in config.py is increased
   INPUT = (1, 1, 0, 0, 1, 1, 0, 1)  # 205
-  # INPUT = (1, 0, 1, 1, 0)  # 22
-  # INPUT = (0, 1, 1, 0)  # 6
+  # INPUT = (1, 0, 1, 1, 0)  # 22, needs DEGREE <= 2
+  # INPUT = (0, 1, 1, 0)  # 6, needs DEGREE = 1
   # INPUT = [1 for _ in range(16)]  # 2^16 - 1 = 65535
 
-  # Set up private values - input digits in order, then powers of two needed
-  # for calculation
+  # One party per digit, so 2T < N needs at least 2*DEGREE+1 digits. For
+  # shorter inputs lower DEGREE by hand, fewer colluding parties are then
+  # tolerated
+
+  # Private values are the input digits in order, the powers of two are 
+  # public constants of CMUL gates
   PRIVATE_VALUES = {i+1: INPUT[i] for i in range(len(INPUT))}
-  for i in range(1, len(INPUT)):
-    PRIVATE_VALUES[i + len(INPUT)] = 2 ** (len(INPUT) - i)
 
   def function(x):	# function being evaluated by parties
-    num_digits = len(x) // 2 + 1
-    acc = x[num_digits]
-    for i in range(1, num_digits):
-      acc += x[i] * x[i + num_digits]
+    num_digits = len(x)
+    acc = 0
+    for i in range(1, num_digits + 1):
+      acc += x[i] * 2 ** (num_digits - i)
     return acc % PRIME
   
   # Test vectors for generate_gates()
@@ -107,77 +126,78 @@ elif CIRCUIT == 3:	# Binary to decimal converter
   # }
 
   # GATES_2_DIGIT = {
-  #   1:  (INP, 4, 1),
-  #   2:  (INP, 5, 1),
-  #   3:  (INP, 4, 2),
+  #   1:  (INP, 3, 1),
+  #   2:  (INP, 4, 1),
   #
-  #   4:  (MUL, 5, 1),  # 4 * x[0]
+  #   3:  (CMUL, 4, 2, 2),  # 2 * x[1]
   #
-  #   5:  (ADD, 6, 1),  # (6,1) is circuit output wire
+  #   4:  (ADD, 5, 1),  # (5,1) is circuit output wire
   # }
 
   # GATES_3_DIGIT = {
-  #   1:  (INP, 6, 1),
-  #   2:  (INP, 7, 1),
-  #   3:  (INP, 9, 2),
-  #   4:  (INP, 6, 2),
-  #   5:  (INP, 7, 2),
+  #   1:  (INP, 4, 1),
+  #   2:  (INP, 5, 1),
+  #   3:  (INP, 6, 1),
   #
-  #   6:  (MUL, 8, 1),  # 4 * x[0]
-  #   7:  (MUL, 8, 2),  # 2 * x[1]
+  #   4:  (CMUL, 6, 2, 4),  # 4 * x[1]
+  #   5:  (CMUL, 7, 2, 2),  # 2 * x[2]
   #
-  #   8:  (ADD, 9, 1),
-  #   9:  (ADD, 10, 1),  # (10,1) is circuit output wire
+  #   6:  (ADD, 7, 1),
+  #   7:  (ADD, 8, 1),  # (8,1) is circuit output wire
   # }
 
   # GATES_4_DIGIT = {
-  #   1:  (INP, 8, 1),
-  #   2:  (INP, 9, 1),
-  #   3:  (INP, 10, 1),
-  #   4:  (INP, 13, 2),
-  #   5:  (INP, 8, 2),
-  #   6:  (INP, 9, 2),
-  #   7:  (INP, 10, 2),
+  #   1:  (INP, 5, 1),
+  #   2:  (INP, 6, 1),
+  #   3:  (INP, 7, 1),
+  #   4:  (INP, 8, 1),
   #
-  #   8:  (MUL, 11, 1),  # 8 * x[0]
-  #   9:  (MUL, 11, 2),  # 4 * x[1]
-  #   10: (MUL, 12, 2),  # 2 * x[2]
+  #   5:  (CMUL, 8, 2, 8),  # 8 * x[1]
+  #   6:  (CMUL, 9, 2, 4),  # 4 * x[2]
+  #   7:  (CMUL, 10, 2, 2),  # 2 * x[3]
   #
-  #   11:  (ADD, 12, 1),
-  #   12:  (ADD, 13, 1),
-  #   13:  (ADD, 14, 1),  # (14,1) is circuit output wire
+  #   8:  (ADD, 9, 1),
+  #   9:  (ADD, 10, 1),
+  #   10: (ADD, 11, 1),  # (11,1) is circuit output wire
   # }
 
   GATES = {}
 
   def generate_gates():
     num_input = len(INPUT)
-    num_pv = len(PRIVATE_VALUES)
 
-    # Input gates
-    for i in range(1, num_input):
-      GATES[i] = (INP, num_pv + i, 1)
-    GATES[num_input] = (
-      INP,
-      2 * num_pv if num_input == 1 else 2 * num_pv - 1,
-      1 if num_input == 1 else 2
-    )
+    # Input gates - all but the last digit are scaled by a CMUL gate, the
+    # last digit starts the chain of ADD gates
     for i in range(1, num_input):
-      GATES[i + num_input] = (INP, i + num_pv, 2)
-    
-    # Multiply gates
+      GATES[i] = (INP, num_input + i, 1)
+    GATES[num_input] = (INP, 2 * num_input, 1)
+
+    # Multiply by constant gates
     for i in range(1, num_input):
-      GATES[i + num_pv] = (
-        MUL,
-        i + num_pv + num_input - 1 if i == 1 else i + num_pv + num_input - 2,
-        1 if i == 1 else 2
-      )
-    
+      GATES[i + num_input] = (CMUL, i + 2 * num_input - 1, 2, 2 ** (num_input - i))
+
     # Add gates
     for i in range(1, num_input):
-      GATES[i + num_pv + num_input - 1] = (ADD, i + num_pv + num_input, 1)
+      GATES[i + 2 * num_input - 1] = (ADD, i + 2 * num_input, 1)
   
   generate_gates()
+
+elif CIRCUIT == 4:	# secret polynomial at a secret point, compiled
+  # ___________________________________________________________________________
+  from compiler import compile_function
+
+  PRIME  = 100_003
+
+  DEGREE = 2
+
+  # parties 1-5 hold the coefficients, party 6 the point
+  PRIVATE_VALUES = {1:7, 2:3, 3:11, 4:5, 5:2, 6:9}
+
+  def function(x):	# function being evaluated by parties
+    return (x[1] + x[2]*x[6] + x[3]*x[6]**2 + x[4]*x[6]**3 + x[5]*x[6]**4) % PRIME
+
+  # gates generated from function() - see compiler.py
+  GATES = compile_function(function, len(PRIVATE_VALUES), PRIME)
   
 # _____________________________________________________________________________
 
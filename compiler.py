@@ -0,0 +1,292 @@
+# compile a python arithmetic function, e.g. function(x) in a circuit module,
+# into a GATES table
+#
+# function is called once with symbolic inputs x[1] .. x[n] that record the
+# +, -, *, ** and % PRIME operations applied to them. the recorded
+# expression is then optimised before gates are emitted:
+#   - constant folding, constants are kept out of the circuit and applied
+#     with CMUL/CADD gates
+#   - common subexpression elimination, equal subexpressions (up to order of
+#     operands) are evaluated once and their gate fans out to every user
+#   - chains of multiplications are flattened and rebuilt as trees that
+#     combine the two shallowest factors first, minimising multiplicative
+#     depth
+#   - sums are a single n-ary ADD gate and products inside a sum are folded
+#     into one DOT gate, so a sum of products costs one degree reduction
+#
+# gates whose value is used more than once list all destinations, e.g.
+# (INP, (7, 9), (1, 2)) feeds input 1 of gate 7 and input 2 of gate 9
+
+import heapq     # heappush, heappop
+
+from circuit2_electric_boogaloo import INP, ADD, MUL, CMUL, CADD, DOT
+
+# ---------------------------------------------------------------------------
+
+class Tracer():
+  # expression graph - nodes are ('inp', party), ('lin', const, terms) with
+  # terms ((node, coefficient), ...) or ('mul', (node, node, ...)), equal
+  # nodes are only stored once
+
+  def __init__(self, prime):
+    self.prime = prime
+    self.nodes = []
+    self.ids = {}
+
+  def node(self, node):
+    if node not in self.ids:
+      self.ids[node] = len(self.nodes)
+      self.nodes.append(node)
+    return self.ids[node]
+
+class Expr():
+  # linear combination const + sum(coefficient * node) of graph nodes
+
+  def __init__(self, tracer, const=0, terms=None):
+    self.tracer = tracer
+    self.const = const % tracer.prime
+    self.terms = {n: c for (n, c) in (terms or {}).items() if c % tracer.prime}
+
+  def lift(self, other):
+    if isinstance(other, Expr):
+      return other
+    if isinstance(other, int):
+      return Expr(self.tracer, other)
+    return NotImplemented
+
+  def atom(self):
+    # return (coefficient, node) with self == coefficient * node
+    if self.const == 0 and len(self.terms) == 1:
+      [(n, c)] = self.terms.items()
+      return c, n
+    terms = tuple(sorted(self.terms.items()))
+    return 1, self.tracer.node(('lin', self.const, terms))
+
+  def __add__(self, other):
+    other = self.lift(other)
+    if other is NotImplemented:
+      return other
+    terms = dict(self.terms)
+    for n, c in other.terms.items():
+      terms[n] = (terms.get(n, 0) + c) % self.tracer.prime
+    return Expr(self.tracer, self.const + other.const, terms)
+
+  def __mul__(self, other):
+    other = self.lift(other)
+    if other is NotImplemented:
+      return other
+    prime = self.tracer.prime
+    for a, b in ((self, other), (other, self)):
+      if not a.terms:   # multiply by a constant
+        return Expr(self.tracer, a.const * b.const,
+                    {n: a.const * c % prime for (n, c) in b.terms.items()})
+    (c1, n1), (c2, n2) = self.atom(), other.atom()
+    product = self.tracer.node(('mul', tuple(sorted((n1, n2)))))
+    return Expr(self.tracer, 0, {product: c1 * c2 % prime})
+
+  def __neg__(self):
+    return self * -1
+
+  def __sub__(self, other):
+    other = self.lift(other)
+    return other if other is NotImplemented else self + (-other)
+
+  def __rsub__(self, other):
+    other = self.lift(other)
+    return other if other is NotImplemented else other + (-self)
+
+  def __pow__(self, exponent):
+    if not isinstance(exponent, int) or exponent < 1:
+      raise TypeError(f"Only positive integer powers can be compiled, not {exponent}")
+    result, square = None, self
+    while exponent:
+      if exponent & 1:
+        result = square if result is None else result * square
+      exponent >>= 1
+      if exponent:
+        square = square * square
+    return result
+
+  def __mod__(self, modulus):
+    if modulus != self.tracer.prime:
+      raise TypeError(f"Only % {self.tracer.prime} can be compiled, not % {modulus}")
+    return self
+
+  __radd__ = __add__
+  __rmul__ = __mul__
+
+# ---------------------------------------------------------------------------
+
+class Emitter():
+  # emits gates for the optimised expression graph, gates are numbered
+  # temporarily in creation order (a topological order) with inputs first
+
+  def __init__(self, tracer, n_inputs, uses):
+    self.tracer = tracer
+    self.uses = uses
+    self.gates = {}      # gate: (kind, [input gates], constant)
+    self.depth = {}
+    self.emitted = {}    # node: gate
+    for p in range(1, n_inputs + 1):
+      self.gates[p] = (INP, [], None)
+      self.depth[p] = 0
+
+  def gate(self, kind, inputs, constant=None):
+    g = len(self.gates) + 1
+    self.gates[g] = (kind, inputs, constant)
+    self.depth[g] = max([self.depth[i] for i in inputs] or [0])
+    if kind in (MUL, DOT):
+      self.depth[g] += 1
+    return g
+
+  def scale(self, g, coefficient):
+    return g if coefficient == 1 else self.gate(CMUL, [g], coefficient)
+
+  def atom(self, n):
+    # return gate computing the value of node n
+    if n not in self.emitted:
+      node = self.tracer.nodes[n]
+      if node[0] == 'inp':
+        self.emitted[n] = node[1]
+      elif node[0] == 'lin':
+        self.emitted[n] = self.linear(node[1], node[2])
+      else:
+        a, b = self.factor_pair(node[1])
+        self.emitted[n] = self.gate(MUL, [a, b])
+    return self.emitted[n]
+
+  def factor_pair(self, factors):
+    # multiply factors in a tree, always combining the two shallowest gates,
+    # until two are left for the final (or DOT) multiplication
+    heap = []
+    for n in factors:
+      g = self.atom(n)
+      heapq.heappush(heap, (self.depth[g], g))
+    while len(heap) > 2:
+      (_, a), (_, b) = heapq.heappop(heap), heapq.heappop(heap)
+      g = self.gate(MUL, [a, b])
+      heapq.heappush(heap, (self.depth[g], g))
+    return heap[0][1], heap[1][1]
+
+  def linear(self, const, terms):
+    # return gate computing const + sum(coefficient * node)
+    if not terms:
+      raise ValueError("Circuit output does not depend on any input")
+    pairs, summands = [], []
+    for n, coefficient in terms:
+      node = self.tracer.nodes[n]
+      if node[0] == 'mul' and self.uses[n] == 1:
+        # product only used here - fold into the DOT gate
+        a, b = self.factor_pair(node[1])
+        pairs += [self.scale(a, coefficient), b]
+      else:
+        summands.append(self.scale(self.atom(n), coefficient))
+    if pairs:
+      summands.append(self.gate(MUL if len(pairs) == 2 else DOT, pairs))
+    g = summands[0] if len(summands) == 1 else self.gate(ADD, summands)
+    return g if const == 0 else self.gate(CADD, [g], const)
+
+# ---------------------------------------------------------------------------
+
+def flatten_products(tracer, root):
+  # inline products used by a single product, x*(y*z) -> x*y*z, so that they
+  # can be rebalanced. returns use counts of the rewritten graph
+  def children(node):
+    if node[0] == 'lin':
+      return [n for (n, _) in node[2]]
+    if node[0] == 'mul':
+      return list(node[1])
+    return []
+
+  def count_uses():
+    uses, stack, seen = {}, [root], set()
+    while stack:
+      n = stack.pop()
+      if n in seen:
+        continue
+      seen.add(n)
+      for child in children(tracer.nodes[n]):
+        uses[child] = uses.get(child, 0) + 1
+        stack.append(child)
+    return uses
+
+  changed = True
+  while changed:
+    changed = False
+    uses = count_uses()
+    for n in [root] + list(uses):
+      node = tracer.nodes[n]
+      if node[0] != 'mul':
+        continue
+      factors = []
+      for f in node[1]:
+        if tracer.nodes[f][0] == 'mul' and uses.get(f) == 1:
+          factors += tracer.nodes[f][1]
+          changed = True
+        else:
+          factors.append(f)
+      tracer.nodes[n] = ('mul', tuple(sorted(factors)))
+  return count_uses()
+
+def compile_function(function, n_inputs, prime):
+  # return GATES for function(x) with inputs x[1] .. x[n_inputs]
+  tracer = Tracer(prime)
+  x = {p: Expr(tracer, 0, {tracer.node(('inp', p)): 1})
+       for p in range(1, n_inputs + 1)}
+  output = function(x)
+  if not isinstance(output, Expr) or not output.terms:
+    raise ValueError("Circuit output does not depend on any input")
+  coefficient, root = output.atom()
+  if coefficient != 1:
+    root = tracer.node(('lin', 0, ((root, coefficient),)))
+
+  uses = flatten_products(tracer, root)
+  uses[root] = uses.get(root, 0) + 1
+  emitter = Emitter(tracer, n_inputs, uses)
+  output_gate = emitter.atom(root)
+  if output_gate != len(emitter.gates) or output_gate <= n_inputs:
+    # output wire must come from the last gate
+    output_gate = emitter.gate(ADD, [output_gate])
+
+  # convert inputs lists to (kind, output_gate, order[, constant])
+  destinations = {g: [] for g in emitter.gates}
+  for g, (_, inputs, _) in emitter.gates.items():
+    for order, i in enumerate(inputs, start=1):
+      destinations[i].append((g, order))
+  destinations[output_gate].append((output_gate + 1, 1))
+
+  gates = {}
+  for g, (kind, _, constant) in emitter.gates.items():
+    if len(destinations[g]) == 1:
+      [(output, order)] = destinations[g]
+    else:
+      output = tuple(d for (d, _) in destinations[g])
+      order = tuple(o for (_, o) in destinations[g])
+    gates[g] = (kind, output, order) if constant is None else \
+               (kind, output, order, constant)
+  return gates
+
+def circuit_stats(gates):
+  # return (resharing gates, multiplicative depth) of a GATES table
+  depth, reshares = {}, 0
+  for g, (kind, output, order, *_) in gates.items():
+    if kind in (MUL, DOT):
+      reshares += 1
+      depth[g] = depth.get(g, 0) + 1
+    outputs = output if isinstance(output, tuple) else (output,)
+    for o in outputs:
+      depth[o] = max(depth.get(o, 0), depth.get(g, 0))
+  return reshares, max(depth.values())
+
+# ---------------------------------------------------------------------------
+
+if __name__ == '__main__':
+  # compile the current circuit's function and compare with its GATES
+  from circuit2_electric_boogaloo import CIRCUIT, GATES, N_PARTIES, PRIME, function
+  compiled = compile_function(function, N_PARTIES, PRIME)
+  print(f'CIRCUIT {CIRCUIT}')
+  for g, gate in compiled.items():
+    print(f'  {g}: {gate},')
+  for name, gates in (('GATES', GATES), ('compiled', compiled)):
+    reshares, depth = circuit_stats(gates)
+    print(f'{name:8}: {len(gates)} gates, {reshares} MUL/DOT, depth {depth}')
@@ -7,10 +7,31 @@ VERBOSE = 0   # 0=quiet, 1+=increasing verbosity
 # set to True to use party no as seed, useful for debugging (mpc.py)
 REPEATABLE_RANDOM_NUMBERS = False
 
-# optional - set to True if you write a non-distributed (non-multiprocess) 
-#   version and wish to test (mpc.py)
+# set to True to evaluate the circuit without processes or sockets, all
+#   parties run as threads over an in-memory network, or to 'vectorized' to
+#   compute all parties' shares for each gate at once (mpc.py, local.py)
 LOCAL = False
 
+# party runtime (mpc.py) - 'sync' evaluates gates in order with bgw_protocol,
+#   'dataflow' runs each gate as an asyncio task as soon as its inputs are
+#   ready (dataflow.py). party processes only, LOCAL always uses 'sync'
+RUNTIME = 'sync'
+
+# degree reduction for MUL/DOT gates (party2_electric_boogaloo.py,
+#   bgw_protocol only) - 'bgw' reshares products, 'open' generates a random
+#   double sharing per gate in an offline phase before the inputs are shared
+#   and opens products masked by them to every party, 'king' does the same
+#   but opens each gate at its king, who sends the value back to everyone
+#   (damgard-nielsen, 2N rather than N^2 messages per gate and for the output)
+DEGREE_REDUCTION = 'bgw'
+
+# number of instances of the circuit evaluated together with packed secret
+#   sharing, instance j's inputs are the circuit's PRIVATE_VALUES + j. up to
+#   DEGREE, but the inputs are then only hidden from coalitions of up to
+#   DEGREE-PACKING+1 parties rather than DEGREE (packed.py, party processes
+#   and LOCAL = True, 1 for no packing)
+PACKING = 1
+
 # ---------------------------------------------------------------------------
 
 # each party will open its own TCP port - at LOCAL_PORT+PartyNo (network.py)
@@ -20,12 +41,60 @@ LOCAL = False
 #   high LOCAL_PORT and pass as a parameter when parties are created.
 LOCAL_PORT = 12340
 
-# increase following two timeouts if running on a slow or overloaded machine
+# transport between parties (network.py) - 'pubsub' for PUB/SUB, which drops
+#   messages once SEND_HWM are queued for a slow party, or 'router' for a
+#   DEALER socket per destination connected to its ROUTER, which makes the
+#   sender wait instead
+TRANSPORT = 'pubsub'
+# 'tcp' (at LOCAL_PORT+PartyNo), 'ipc' for parties on the same host, or
+#   'inproc' for parties running as threads (LOCAL = True) in one process
+ENDPOINT = 'tcp'
+# high water marks - messages queued per socket and peer before PUB drops
+#   or DEALER blocks, and kernel socket buffer sizes in bytes (None for the
+#   OS default)
+SEND_HWM = 1000
+RECEIVE_HWM = 1000
+SEND_BUFFER = None
+RECEIVE_BUFFER = None
+
+# long-lived parties (daemon.py) take jobs from a client at JOB_PORT+PartyNo,
+#   python3 daemon.py runs DAEMON_JOBS jobs through them
+JOB_PORT = 13340
+DAEMON_JOBS = 100
+# jobs a client keeps in flight, each party evaluates them concurrently in
+#   their own network sessions (daemon.py, network.py)
+CONCURRENT_JOBS = 8
+
+# streaming evaluation (stream.py) - each party's inputs, one per line, are
+#   read from STREAM_INPUTS.format(party=PartyNo), or if None are
+#   STREAM_LENGTH values counting up from its PRIVATE_VALUE. up to
+#   PIPELINE_DEPTH evaluations are in flight at once
+STREAM_INPUTS = None    # e.g. 'inputs/party{party}.txt'
+STREAM_LENGTH = 200
+PIPELINE_DEPTH = 8
+
+# increase following timeout if running on a slow or overloaded machine
 #   all parties will be terminated after this number of seconds (mpc.py)
 MAX_TIME = 5
-# each party will sleep for this number of seconds before connecting to other
-#   parties (network.py)
-SYNC_DELAY = 2
+# seconds a party waits for a quorum of shares in one round before giving up
+#   with a TimeoutError, separate from MAX_TIME as long-lived parties
+#   (daemon.py, stream.py) run for longer than any one evaluation
+ROUND_TIMEOUT = 5
+# parties announce their readiness to each other every READY_INTERVAL
+#   milliseconds until all of them are connected (network.py)
+READY_INTERVAL = 10
+
+# bytes read from the OS's random source at a time, random field elements
+#   for polynomial coefficients are drawn from the buffer (modprime.py)
+RANDOM_BUFFER = 65536
+
+# recombination vectors are computed once by the top-level process and
+#   loaded from this file by parties (recombination.py, mpc.py)
+RECOMBINATION_CACHE = 'recombination_cache.json'
+
+# compiled circuit plans are saved by the top-level process and memory-mapped
+#   from this file by parties, if it holds the plan for their GATES (plan.py)
+PLAN_CACHE = 'plan_cache.bin'
 
 # pkill pattern - used to kill zombie or runaway processes (Makefile, mpc.py)
 PKILL_PATTERN = 'MPC_PROCESS'
@@ -0,0 +1,207 @@
+# long-lived parties that evaluate jobs submitted by a client
+#
+# each party process imports the circuit, builds its plan and connects its
+# Network once, then evaluates jobs as they arrive, each in its own thread
+# and network session (numbered by the client's random job id), so one job's
+# computation fills another's wait for the network. a job is the circuit id
+# and every party's input - a Client sends each party its input on a DEALER
+# socket connected to the party's ROUTER socket at JOB_PORT+PartyNo and
+# gets back {party: result}. parties serve the circuit they were started
+# with (CIRCUIT), jobs for any other circuit are rejected
+#
+#   python3 daemon.py                  starts the parties, runs DAEMON_JOBS
+#                                      jobs with random inputs through them,
+#                                      CONCURRENT_JOBS at a time, and stops
+#                                      them
+#   python3 daemon.py serve-all        starts the parties and leaves them
+#                                      serving jobs until stopped
+#   python3 daemon.py stop             stops running parties
+#   python3 daemon.py party_no pattern runs a party (started by the above)
+#
+# other programs submit jobs with Client, e.g.
+#   Client().submit({1: 20, 2: 40, ...}) returns {party: result}
+
+import json       # dumps, loads
+import random     # randrange
+import secrets    # randbelow
+import subprocess # Popen
+import sys        # argv
+import threading  # Thread
+import time       # perf_counter
+import zmq        # Context, Poller, DEALER, ROUTER, PUSH, PULL
+
+from circuit2_electric_boogaloo import ALL_PARTIES, CIRCUIT, DEGREE, N_PARTIES, PRIME, function
+from config  import CONCURRENT_JOBS, DAEMON_JOBS, JOB_PORT, MAX_TIME, PKILL_PATTERN
+from log     import init_logging, write
+from network import Network
+from party2_electric_boogaloo import PLAN, bgw_protocol
+import recombination
+
+# finished jobs' replies go from their threads to the party's main thread
+REPLIES = 'inproc://daemon-replies'
+
+# ---------------------------------------------------------------------------
+
+def serve(party_no):
+  # evaluate jobs until told to stop
+  init_logging(party_no)
+  network = Network(party_no)
+  context = zmq.Context.instance()
+  jobs = context.socket(zmq.ROUTER)
+  jobs.bind(f'tcp://*:{JOB_PORT+party_no}')
+  replies = context.socket(zmq.PULL)
+  replies.bind(REPLIES)
+  poller = zmq.Poller()
+  poller.register(jobs, zmq.POLLIN)
+  poller.register(replies, zmq.POLLIN)
+  write(f"Serving circuit {CIRCUIT}")
+
+  while True:
+    events = dict(poller.poll())
+    if replies in events:
+      jobs.send_multipart(replies.recv_multipart())
+    if jobs in events:
+      client, message = jobs.recv_multipart()
+      job = json.loads(message)
+      if job.get('stop'):
+        jobs.send_multipart([client, json.dumps({'job': job['job'], 'stopped': True}).encode()])
+        return
+      if job['circuit'] != CIRCUIT:
+        error = f"Serving circuit {CIRCUIT}, not {job['circuit']}"
+        jobs.send_multipart([client, json.dumps({'job': job['job'], 'error': error}).encode()])
+        continue
+      threading.Thread(target=run_job, args=(network, client, job), daemon=True).start()
+
+def run_job(network, client, job):
+  # evaluate job in its own session and reply through the main thread, with
+  # an error if a round timed out
+  start = time.perf_counter()
+  init_logging(network.party_no)
+  try:
+    result = bgw_protocol(network.party_no, job['input'], network.session(job['job']))
+    reply = {'job': job['job'], 'result': result, 'time': time.perf_counter() - start}
+  except TimeoutError as error:
+    reply = {'job': job['job'], 'error': f"Party {network.party_no}: {error}"}
+  finally:
+    network.end_session(job['job'])
+  replies = zmq.Context.instance().socket(zmq.PUSH)
+  replies.connect(REPLIES)
+  replies.send_multipart([client, json.dumps(reply).encode()])
+  replies.close()
+
+class Client():
+  # submits jobs to running parties. parties use the job id as the session,
+  # so ids are random 32-bit numbers (never 0, the network's own session)
+  # and jobs from any number of clients don't collide
+
+  def __init__(self, timeout=MAX_TIME):
+    context = zmq.Context.instance()
+    self.timeout = timeout
+    self.sockets = {}
+    self.poller = zmq.Poller()
+    for p in ALL_PARTIES:
+      self.sockets[p] = context.socket(zmq.DEALER)
+      self.sockets[p].connect(f'tcp://localhost:{JOB_PORT+p}')
+      self.poller.register(self.sockets[p], zmq.POLLIN)
+    self.parties = {socket: p for (p, socket) in self.sockets.items()}
+
+  def send(self, messages):
+    # send {party: message} as a new job, returns its id
+    job = secrets.randbelow(2**32 - 1) + 1
+    for p, socket in self.sockets.items():
+      socket.send_json({'job': job, **messages[p]})
+    return job
+
+  def receive(self):
+    # return [(party, reply)] for the replies that have arrived
+    events = self.poller.poll(self.timeout * 1000)
+    if not events:
+      raise TimeoutError(f"No reply from any party in {self.timeout}s")
+    return [(self.parties[socket], socket.recv_json()) for (socket, _) in events]
+
+  def submit_all(self, all_inputs, circuit=CIRCUIT, concurrent=CONCURRENT_JOBS):
+    # evaluate circuit with each {party: input} of all_inputs, up to
+    # concurrent jobs at a time, returns [{party: result}] in the same order
+    results = [None] * len(all_inputs)
+    pending = {}   # job: (index, {party: reply})
+    next_index = 0
+    while next_index < len(all_inputs) or pending:
+      while next_index < len(all_inputs) and len(pending) < concurrent:
+        inputs = all_inputs[next_index]
+        job = self.send({p: {'circuit': circuit, 'input': inputs.get(p, 0)}
+                         for p in ALL_PARTIES})
+        pending[job] = (next_index, {})
+        next_index += 1
+      for p, reply in self.receive():
+        index, replies = pending[reply['job']]
+        replies[p] = reply
+        if 'error' in reply:
+          raise ValueError(reply['error'])
+        if len(replies) == N_PARTIES:
+          del pending[reply['job']]
+          results[index] = {p: r['result'] for (p, r) in replies.items()}
+    return results
+
+  def submit(self, inputs, circuit=CIRCUIT):
+    # evaluate circuit with {party: input}, returns {party: result}
+    return self.submit_all([inputs], circuit)[0]
+
+  def stop(self):
+    self.send({p: {'stop': True} for p in ALL_PARTIES})
+    stopped = 0
+    while stopped < N_PARTIES:
+      stopped += len(self.receive())
+
+# ---------------------------------------------------------------------------
+
+def start_parties():
+  # start a party process per party, returns their Popens
+  recombination.precompute([DEGREE + 1, 2*DEGREE + 1], N_PARTIES)
+  recombination.save()
+  PLAN.save()
+  return [subprocess.Popen(['python3', 'daemon.py', str(p), PKILL_PATTERN],
+                           stdout=subprocess.DEVNULL)
+          for p in ALL_PARTIES]
+
+def serve_all():
+  # start the parties and wait until a client stops them
+  print(f'CIRCUIT {CIRCUIT}')
+  parties = start_parties()
+  print(f'Serving jobs at ports {JOB_PORT+1}..{JOB_PORT+N_PARTIES}, '
+        f'python3 daemon.py stop to stop')
+  for party in parties:
+    party.wait()
+
+def main():
+  print(f'CIRCUIT {CIRCUIT}')
+  start = time.perf_counter()
+  parties = start_parties()
+  client = Client()
+
+  # the first job includes the parties' start up
+  all_inputs = [{p: random.randrange(PRIME) for p in ALL_PARTIES}
+                for _ in range(DAEMON_JOBS)]
+  results = [client.submit(all_inputs[0])]
+  first = time.perf_counter() - start
+  results += client.submit_all(all_inputs[1:])
+  elapsed = time.perf_counter() - start
+  client.stop()
+  for party in parties:
+    party.wait()
+
+  correct = sum(all(r == function(inputs) for r in result.values())
+                for (inputs, result) in zip(all_inputs, results))
+  print(f'{correct}/{DAEMON_JOBS} jobs correct in {elapsed:.3f}s, first job '
+        f'{first:.3f}s (with start up), then '
+        f'{(elapsed - first) / max(1, DAEMON_JOBS - 1) * 1000:.1f}ms per job '
+        f'({CONCURRENT_JOBS} at a time)')
+
+if __name__ == '__main__':
+  if len(sys.argv) == 1:
+    main()
+  elif sys.argv[1] == 'serve-all':
+    serve_all()
+  elif sys.argv[1] == 'stop':
+    Client().stop()
+  else:
+    serve(int(sys.argv[1]))
@@ -0,0 +1,236 @@
+# asyncio dataflow runtime for a party - every gate is a task that awaits the
+# wires feeding it, so gates run as soon as their inputs are ready instead of
+# in GATES order, independent parts of a circuit proceed concurrently and
+# shares are handled in whatever order they arrive
+#
+# runs the same GATES tables and protocol as bgw_protocol
+# (party2_electric_boogaloo.py) over zmq.asyncio sockets with the configured
+# transport (network.py). MUL/DOT gates are reshared one gate at a time by
+# resharing_committee([gate]), shares sent in the same iteration of the event
+# loop go out as one message per destination party
+#
+# python3 dataflow.py benchmarks the distributed run (mpc.py) of the current
+# circuit with bgw_protocol ('sync') against this runtime ('dataflow')
+
+import asyncio   # run, Future, create_task, gather, wait_for
+import functools # partial
+import re        # findall - only for the benchmark
+import statistics # median - only for the benchmark
+import subprocess # run - only for the benchmark
+import zmq       # PUB, SUB, DEALER, ROUTER
+import zmq.asyncio # Context
+
+import wire      # encode, decode
+import recombination
+from circuit2_electric_boogaloo import ALL_PARTIES, CIRCUIT, DEGREE, INP, MUL, DOT, N_PARTIES
+from config   import READY_INTERVAL, ROUND_TIMEOUT, TRANSPORT
+from log      import init_logging, write, debug
+from modprime import mul, summation
+from network  import READY_GATE, endpoint, socket
+from party2_electric_boogaloo import PLAN, OUTPUT_GATE, evaluate_local, resharing_committee, share_secrets
+
+# ---------------------------------------------------------------------------
+
+class AsyncNetwork():
+  # sending and receiving shares with coroutines, received shares resolve
+  # futures in a mailbox {(party, gate): future}
+
+  def __init__(self, party_no):
+    self.party_no = party_no
+    context = zmq.asyncio.Context.instance()
+    if TRANSPORT == 'router':
+      self.receiver = socket(zmq.ROUTER, context)
+      self.receiver.bind(endpoint(party_no, bind=True))
+      self.senders = {p: socket(zmq.DEALER, context) for p in ALL_PARTIES}
+      for p, sender in self.senders.items():
+        sender.connect(endpoint(p, bind=False))
+    else:
+      publisher = socket(zmq.PUB, context)
+      publisher.bind(endpoint(party_no, bind=True))
+      self.senders = {p: publisher for p in ALL_PARTIES}
+      self.receiver = socket(zmq.SUB, context)
+      self.receiver.setsockopt(zmq.SUBSCRIBE, wire.topic(party_no))
+      for p in ALL_PARTIES:
+        self.receiver.connect(endpoint(p, bind=False))
+    self.mailbox = {}
+    self.closed_gates = set()
+    self.outbox = {}     # {dest: {gate: share}} waiting for the next flush
+    self.tasks = set()   # running flushes and the receiver
+
+  async def start(self):
+    # readiness handshake as in Network.wait_until_ready, then receive in
+    # the background
+    heard, ready = set(), set()
+    announced = False
+    while not (announced and len(ready) == N_PARTIES):
+      is_ready = len(heard) == N_PARTIES
+      for dest_party in ALL_PARTIES:
+        await self.send_now(dest_party, {READY_GATE: int(is_ready)})
+      announced = is_ready
+      timeout = READY_INTERVAL
+      while await self.receiver.poll(timeout):
+        sender, msg = await self.receive_message()
+        if READY_GATE in msg:
+          heard.add(sender)
+          if msg[READY_GATE]:
+            ready.add(sender)
+        else:
+          self.store(sender, msg)
+        timeout = 0
+    self.spawn(self.receive_forever())
+
+  def spawn(self, coroutine):
+    task = asyncio.create_task(coroutine)
+    self.tasks.add(task)
+    task.add_done_callback(self.tasks.discard)
+
+  async def receive_message(self):
+    # return (sender, {gate: share}), ROUTER frames are [identity, message]
+    frames = await self.receiver.recv_multipart(copy=False)
+    sender, _session, msg = wire.decode(frames[-1].buffer)
+    return sender, msg
+
+  async def receive_forever(self):
+    while True:
+      sender, msg = await self.receive_message()
+      if READY_GATE not in msg:   # skip late readiness messages
+        self.store(sender, msg)
+
+  def future(self, src_party, src_gate):
+    key = (src_party, src_gate)
+    if key not in self.mailbox:
+      self.mailbox[key] = asyncio.get_running_loop().create_future()
+    return self.mailbox[key]
+
+  def store(self, src_party, shares):
+    # resolve the futures for received shares, except late ones for gates
+    # with a quorum
+    for gate, share in shares.items():
+      if gate not in self.closed_gates:
+        self.future(src_party, gate).set_result(share)
+
+  def send_shares(self, dest_party, shares):
+    # queue shares for dest_party, everything queued before the event loop
+    # next runs a callback is sent together
+    if not self.outbox:
+      asyncio.get_running_loop().call_soon(self.spawn, self.flush())
+    self.outbox.setdefault(dest_party, {}).update(shares)
+
+  async def flush(self):
+    outbox, self.outbox = self.outbox, {}
+    for dest_party, shares in outbox.items():
+      await self.send_now(dest_party, shares)
+
+  async def send_now(self, dest_party, shares):
+    frame = wire.encode(dest_party, self.party_no, shares)
+    await self.senders[dest_party].send(frame, copy=False)
+
+  async def receive_share(self, src_party, src_gate):
+    share = await self.future(src_party, src_gate)
+    del self.mailbox[(src_party, src_gate)]
+    return share
+
+  async def receive_quorum(self, src_gate, quorum, timeout=None):
+    # return {party: share} for gate from the first quorum parties to send it
+    arrived = {}
+    reached = asyncio.get_running_loop().create_future()
+
+    def arrive(src_party, future):
+      if not reached.done():
+        arrived[src_party] = future.result()
+        if len(arrived) == quorum:
+          reached.set_result(dict(arrived))
+
+    for p in ALL_PARTIES:
+      self.future(p, src_gate).add_done_callback(functools.partial(arrive, p))
+    try:
+      shares = await asyncio.wait_for(reached, timeout)
+    except asyncio.TimeoutError:
+      raise TimeoutError(f"Only {len(arrived)}/{quorum} shares for gate {src_gate}")
+    self.closed_gates.add(src_gate)
+    for p in ALL_PARTIES:
+      self.mailbox.pop((p, src_gate), None)
+    return shares
+
+# ---------------------------------------------------------------------------
+
+async def dataflow_protocol(party_no, private_value, network):
+  # bgw_protocol with one task per gate, returns the result
+  init_logging(party_no)
+  await network.start()
+  loop = asyncio.get_running_loop()
+  wires = {g: loop.create_future() for g in range(1, PLAN.n_gates + 1)}
+
+  # split private input
+  if party_no <= PLAN.n_inputs:
+    shares = share_secrets([private_value])
+    for dest_party in ALL_PARTIES:
+      network.send_shares(dest_party, {party_no: shares[dest_party][0]})
+
+  # evaluate the circuit, each gate waits for its own inputs
+  gates = [asyncio.create_task(evaluate_gate(g, wires, network))
+           for g in range(1, PLAN.n_gates + 1)]
+  await asyncio.gather(*gates)
+  result = wires[PLAN.gate_inputs(OUTPUT_GATE)[0]].result()
+
+  # broadcast output share and combine the first T+1 to arrive
+  for dest_party in ALL_PARTIES:
+    network.send_shares(dest_party, {OUTPUT_GATE: result})
+  outputs = await network.receive_quorum(OUTPUT_GATE, DEGREE + 1, ROUND_TIMEOUT)
+  recombination_vector = recombination.recombination_vector(outputs)
+  result = summation([outputs[p] * recombination_vector[p] for p in outputs])
+  write(f"Final result is {result}")
+  return result
+
+async def evaluate_gate(key, wires, network):
+  input_gates = PLAN.gate_inputs(key)
+  inputs = [await wires[i] for i in input_gates]
+  gate_type = PLAN.kind[key]
+  if gate_type == INP:
+    # input gate key is the share sent by party key
+    value = await network.receive_share(key, key)
+  elif gate_type in (MUL, DOT):
+    value = await multiply(key, inputs, network)
+  else:
+    value = evaluate_local(key, None, dict(zip(input_gates, inputs)))
+  wires[key].set_result(value)
+
+async def multiply(key, inputs, network):
+  # degree reduction for a single MUL/DOT gate by its resharing committee
+  committee = resharing_committee([key])
+  if network.party_no in committee:
+    private_value = summation([mul(a, b) for (a, b) in zip(inputs[0::2], inputs[1::2])])
+    shares = share_secrets([private_value])
+    for dest_party in ALL_PARTIES:
+      network.send_shares(dest_party, {key: shares[dest_party][0]})
+  received = await asyncio.gather(*[network.receive_share(p, key) for p in committee])
+  recombination_vector = recombination.recombination_vector(committee)
+  result = summation([share * recombination_vector[p]
+                      for (p, share) in zip(committee, received)])
+  debug(f"MUL gate {key} result {result} from committee {committee}")
+  return result
+
+def run(party_no, private_value):
+  # run the party to completion in its own event loop, returns the result
+  async def party():
+    return await dataflow_protocol(party_no, private_value, AsyncNetwork(party_no))
+  return asyncio.run(party())
+
+# ---------------------------------------------------------------------------
+
+def benchmark(runtime, repeats=5):
+  # median over repeats of the slowest party's wall time running mpc.py
+  times = []
+  for _ in range(repeats):
+    output = subprocess.run(['python3', 'mpc.py', runtime], text=True,
+                            capture_output=True).stdout
+    party_times = [float(t) for t in re.findall(r'result \d+ in ([\d.]+)s ok', output)]
+    if len(party_times) != N_PARTIES:
+      raise RuntimeError(f"{runtime} run failed:\n{output}")
+    times.append(max(party_times))
+  return statistics.median(times)
+
+if __name__ == '__main__':
+  print(f'CIRCUIT {CIRCUIT}: {PLAN.n_gates} gates, {N_PARTIES} parties')
+  for runtime in ('sync', 'dataflow'):
+    print(f'{runtime:8}: slowest party {benchmark(runtime):.3f}s (median of 5 runs)')
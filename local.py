@@ -0,0 +1,162 @@
+# non-distributed circuit evaluation - all parties in a single process
+#
+# LOCAL = True         - runs every party's bgw_protocol in its own thread
+#                        against an in-memory LocalNetwork with the same
+#                        interface as Network, or against a Network over
+#                        zmq when ENDPOINT = 'inproc'
+# LOCAL = 'vectorized' - evaluates the circuit in lockstep, computing all
+#                        parties' shares for a gate at once, no transport
+
+import functools # reduce
+import threading # Thread, Condition
+import time      # perf_counter
+
+from circuit2_electric_boogaloo import ALL_PARTIES, DEGREE, INP, ADD, MUL, CMUL, CADD, DOT, N_PARTIES, PRIVATE_VALUES
+from config  import ENDPOINT, LOCAL, MAX_TIME, PACKING
+from network import Network
+from packed  import INSTANCES, packed_protocol
+from modprime import vector, matrix, to_list, vadd, vmul, vscale, dot, matmul
+from party2_electric_boogaloo import PLAN, OUTPUT_GATE, bgw_protocol, calc_recombination_vector, resharing_committee, share_secrets
+import recombination
+
+# ---------------------------------------------------------------------------
+
+class Switchboard():
+  # in-memory mailboxes shared by all parties, {dest: {(src, gate): share}},
+  # each with a condition only its party waits on, and the gates each party
+  # has closed after receiving a quorum
+
+  def __init__(self):
+    self.conditions = {p: threading.Condition() for p in ALL_PARTIES}
+    self.mailboxes = {p: {} for p in ALL_PARTIES}
+    self.closed_gates = {p: set() for p in ALL_PARTIES}
+
+class LocalNetwork():
+  # sending and receiving shares between parties in the same process
+
+  def __init__(self, party_no, switchboard):
+    self.party_no = party_no
+    self.switchboard = switchboard
+    self.mailbox = switchboard.mailboxes[party_no]
+    self.condition = switchboard.conditions[party_no]
+
+  def send_share(self, share, src_gate, dest_party):
+    self.send_shares(dest_party, {src_gate: share})
+
+  def send_shares(self, dest_party, shares):
+    mailbox = self.switchboard.mailboxes[dest_party]
+    closed_gates = self.switchboard.closed_gates[dest_party]
+    condition = self.switchboard.conditions[dest_party]
+    with condition:
+      for gate, share in shares.items():
+        if gate not in closed_gates:
+          mailbox[(self.party_no, gate)] = share
+      condition.notify()   # wake the destination party, the only waiter
+
+  def receive_share(self, src_party, src_gate):
+    return self.receive_shares(src_party, [src_gate])[src_gate]
+
+  def receive_shares(self, src_party, src_gates):
+    # shares are removed from the mailbox once received
+    with self.condition:
+      self.condition.wait_for(
+        lambda: all((src_party, g) in self.mailbox for g in src_gates))
+      return {g: self.mailbox.pop((src_party, g)) for g in src_gates}
+
+  def receive_quorum(self, src_gate, quorum, timeout=None):
+    # return {party: share} for gate from the first quorum parties to send it
+    arrived = []
+    def reached():
+      arrived.extend(p for p in ALL_PARTIES
+                     if (p, src_gate) in self.mailbox and p not in arrived)
+      return len(arrived) >= quorum
+    with self.condition:
+      if not self.condition.wait_for(reached, timeout):
+        raise TimeoutError(f"Only {len(arrived)}/{quorum} shares for gate {src_gate}")
+      self.switchboard.closed_gates[self.party_no].add(src_gate)
+      shares = {p: self.mailbox.pop((p, src_gate)) for p in arrived}
+    return dict(list(shares.items())[:quorum])
+
+# ---------------------------------------------------------------------------
+
+def simulate_threads():
+  # return {party: (result, wall time)} running each party in a thread
+  switchboard = Switchboard()
+  results = {}
+
+  def run_party(party_no):
+    start = time.perf_counter()
+    if ENDPOINT == 'inproc':
+      network = Network(party_no)
+    else:
+      network = LocalNetwork(party_no, switchboard)
+    if PACKING > 1:
+      inputs = [instance[party_no] for instance in INSTANCES]
+      result = packed_protocol(party_no, inputs, network)
+    else:
+      result = bgw_protocol(party_no, PRIVATE_VALUES[party_no], network)
+    results[party_no] = (result, time.perf_counter() - start)
+
+  threads = [threading.Thread(target=run_party, args=(p,), daemon=True)
+             for p in ALL_PARTIES]
+  for thread in threads:
+    thread.start()
+  deadline = time.perf_counter() + MAX_TIME
+  for thread in threads:
+    thread.join(max(0, deadline - time.perf_counter()))
+  return results
+
+def share(secret):
+  # return vector of shares of secret for each party
+  shares = share_secrets([secret])
+  return vector([shares[p][0] for p in ALL_PARTIES])
+
+def reshare(products, committee):
+  # degree reduction - the 2T+1 committee parties reshare their products,
+  # every party combines the shares it receives with the recombination vector
+  products = to_list(products)
+  shares = share_secrets([products[p - 1] for p in committee])
+  resharing = matrix(list(zip(*[shares[p] for p in ALL_PARTIES])))
+  recombination_vector = recombination.recombination_vector(committee)
+  weights = matrix([[recombination_vector[i] for i in committee]])
+  return vector(to_list(matmul(weights, resharing)[0]))
+
+def simulate_vectorized():
+  # return {party: (result, wall time)} evaluating the circuit for all
+  # parties at once, shares for a wire are held as a vector (modprime.py)
+  # indexed by party-1
+  start = time.perf_counter()
+  values = {}
+
+  for step, gates in PLAN.steps():
+    committee = resharing_committee(gates)
+    for key in gates:
+      gate_type = PLAN.kind[key]
+      inputs = [values[i] for i in PLAN.gate_inputs(key)]
+      if gate_type in (MUL, DOT):
+        # each party adds its products of the input pairs
+        products = functools.reduce(vadd, map(vmul, inputs[0::2], inputs[1::2]))
+        values[key] = reshare(products, committee)
+      elif gate_type == INP:
+        values[key] = share(PRIVATE_VALUES[key])
+      elif gate_type == ADD:
+        values[key] = functools.reduce(vadd, inputs)
+      elif gate_type == CMUL:
+        values[key] = vscale(inputs[0], PLAN.constant[key])
+      elif gate_type == CADD:
+        values[key] = vadd(inputs[0], vector([PLAN.constant[key]] * N_PARTIES))
+    for key in PLAN.released(step):
+      del values[key]
+
+  # every party recombines the output shares of the first T+1 parties
+  outputs = to_list(values[PLAN.gate_inputs(OUTPUT_GATE)[0]])
+  recombination_vector = calc_recombination_vector(DEGREE + 1)
+  result = dot(vector(outputs[:DEGREE + 1]),
+               vector([recombination_vector[i] for i in range(1, DEGREE + 2)]))
+  wall_time = time.perf_counter() - start
+  return {p: (result, wall_time) for p in ALL_PARTIES}
+
+def simulate_parties():
+  if LOCAL == 'vectorized':
+    return simulate_vectorized()
+  return simulate_threads()
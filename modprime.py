@@ -4,9 +4,22 @@
 # arithmetic modulo a prime number
 
 import functools # reduce
-import random    # randint
+import hashlib   # shake_256
+import os        # urandom
+import threading # Lock
+
+try:
+  import numpy   # optional - fast path for vectors when PRIME < 2^31
+except ImportError:
+  numpy = None
+
+try:
+  import gmpy2   # optional - faster big integers for large primes
+except ImportError:
+  gmpy2 = None
 
 from circuit2_electric_boogaloo import PRIME
+from config import RANDOM_BUFFER
 
 # ---------------------------------------------------------------------------
 
@@ -23,18 +36,185 @@ def mul(a, b):
   return (a * b) % PRIME
 
 def inv(a):
-  # compute multiplicative inverse (mod p) using fermat's little theorem 
-  return pow(a, PRIME-2, PRIME)
+  # compute multiplicative inverse (mod p), pow uses the extended euclidean
+  # algorithm which is much cheaper than fermat's little theorem a^(p-2)
+  return pow(a, -1, PRIME)
 
 def div(a, b):
   return mul(a, inv(b))
 
 def randint():
-  return random.randint(1, PRIME-1)
+  return SOURCE.elements(1)[0]
+
+def randints(count):
+  # count random elements in one draw from the buffer
+  return SOURCE.elements(count)
+
+def seed(value):
+  # switch to a repeatable stream of random elements seeded by value
+  global SOURCE
+  SOURCE = RandomSource(value)
 
 def summation(list):
-  return functools.reduce(add, list)
+  return sum(list) % PRIME
 
 def product(list):
   return functools.reduce(mul, list)
 
+# ---------------------------------------------------------------------------
+# batch operations on vectors (and matrices) of field elements
+#
+# vectors are numpy int64 arrays if numpy is installed and products of two
+# elements fit in 63 bits (PRIME < 2^31), otherwise lists of python ints (or
+# gmpy2 mpz's if installed). use vector()/matrix() to create them and
+# to_list() to get python ints back
+
+if numpy is not None and PRIME < 2**31:
+  BACKEND = 'numpy'
+elif gmpy2 is not None:
+  BACKEND = 'gmpy2'
+else:
+  BACKEND = 'python'
+
+if BACKEND == 'numpy':
+  LIMB = 2**16    # split operands of matmul so sums of products fit int64
+
+  def vector(values):
+    return numpy.array([v % PRIME for v in values], dtype=numpy.int64)
+
+  def matrix(rows):
+    return numpy.array([[v % PRIME for v in row] for row in rows],
+                       dtype=numpy.int64).reshape(len(rows), -1)
+
+  def to_list(v):
+    return v.tolist()
+
+  def vadd(a, b):
+    return (a + b) % PRIME
+
+  def vsub(a, b):
+    return (a - b) % PRIME
+
+  def vmul(a, b):
+    return (a * b) % PRIME
+
+  def vscale(a, c):
+    return (a * (c % PRIME)) % PRIME
+
+  def matmul(m, x):
+    # m (rows x k) times x (k or k x columns), sums of k products of 31 bit
+    # numbers overflow int64, so x is split into 16 bit limbs (k < 2^16)
+    high, low = numpy.divmod(x, LIMB)
+    return ((m @ high % PRIME) * LIMB + m @ low % PRIME) % PRIME
+
+  def dot(a, b):
+    return int(matmul(a.reshape(1, -1), b)[0])
+
+else:
+  convert = gmpy2.mpz if BACKEND == 'gmpy2' else int
+
+  def vector(values):
+    return [convert(v % PRIME) for v in values]
+
+  def matrix(rows):
+    return [vector(row) for row in rows]
+
+  def to_list(v):
+    # a vector or, for matmul results, a list of rows
+    return [to_list(e) if isinstance(e, list) else int(e) for e in v]
+
+  def vadd(a, b):
+    return [(x + y) % PRIME for (x, y) in zip(a, b)]
+
+  def vsub(a, b):
+    return [(x - y) % PRIME for (x, y) in zip(a, b)]
+
+  def vmul(a, b):
+    return [(x * y) % PRIME for (x, y) in zip(a, b)]
+
+  def vscale(a, c):
+    return [(x * c) % PRIME for x in a]
+
+  def dot(a, b):
+    return int(sum(x * y for (x, y) in zip(a, b)) % PRIME)
+
+  def matmul(m, x):
+    # m (rows x k) times x (k or k x columns)
+    if x and isinstance(x[0], list):
+      columns = list(zip(*x))
+      return [[sum(a * b for (a, b) in zip(row, column)) % PRIME
+               for column in columns] for row in m]
+    return [sum(a * b for (a, b) in zip(row, x)) % PRIME for row in m]
+
+def batch_inv(values, prime=PRIME):
+  # inverses of all values with a single inversion (montgomery's trick) -
+  # prefix products p[i] = v[0]..v[i], then walk back from inv(p[n-1])
+  values = [v % prime for v in values]
+  prefix, acc = [], 1
+  for v in values:
+    acc = acc * v % prime
+    prefix.append(acc)
+  inverses = [0] * len(values)
+  acc = pow(acc, -1, prime) if values else 1
+  for i in range(len(values) - 1, 0, -1):
+    inverses[i] = acc * prefix[i-1] % prime
+    acc = acc * values[i] % prime
+  if values:
+    inverses[0] = acc
+  return inverses
+
+# ---------------------------------------------------------------------------
+# random field elements from a buffered cryptographic source
+#
+# bytes come from the OS (os.urandom) RANDOM_BUFFER at a time, or for
+# repeatable runs (seed) from SHAKE-256 of the seed and a block counter.
+# each element is a fixed width draw masked to PRIME's bit
+# length and rejected unless 1 <= e < PRIME, so elements are uniform and at
+# least about half of the draws are kept
+
+BITS = PRIME.bit_length()
+WIDTH = next((w for w in (1, 2, 4, 8) if 8*w >= BITS), (BITS + 7) // 8)
+MASK = (1 << BITS) - 1
+FORMATS = {1: 'B', 2: 'H', 4: 'I', 8: 'Q'}   # memoryview casts, native order
+
+class RandomSource():
+
+  def __init__(self, seed=None):
+    self.seed = seed
+    self.blocks = 0
+    self.buffer = b''
+    self.offset = 0
+    self.lock = threading.Lock()   # parties as threads (local.py) share one
+
+  def fill(self, size):
+    if self.seed is None:
+      return os.urandom(size)
+    self.blocks += 1
+    return hashlib.shake_256(f'{self.seed}:{self.blocks}'.encode()).digest(size)
+
+  def read(self, size):
+    # next size bytes, refilling the buffer when it runs out
+    if self.offset + size > len(self.buffer):
+      self.buffer = self.buffer[self.offset:] + self.fill(max(size, RANDOM_BUFFER))
+      self.offset = 0
+    data = self.buffer[self.offset:self.offset + size]
+    self.offset += size
+    return data
+
+  def elements(self, count):
+    # count uniform random elements of 1..PRIME-1
+    result = []
+    with self.lock:
+      while len(result) < count:
+        needed = count - len(result)
+        draws = needed * (1 << BITS) // (PRIME - 1) + 8
+        data = self.read(draws * WIDTH)
+        if WIDTH in FORMATS:
+          values = memoryview(data).cast(FORMATS[WIDTH])
+        else:
+          values = [int.from_bytes(data[i:i + WIDTH], 'little')
+                    for i in range(0, len(data), WIDTH)]
+        result += [v for v in (v & MASK for v in values) if 0 < v < PRIME]
+    return result[:count]
+
+SOURCE = RandomSource()
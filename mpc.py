@@ -1,55 +1,123 @@
 # secure multi-party computation, semi-honest case, distributed, v1
 # naranker dulay, dept of computing, imperial college, october 2020
 
-import random     # seed
+import os         # pipe, fdopen
+import selectors  # DefaultSelector
 import subprocess # Popen
 import sys        # argv
-import time       # sleep
+import time       # perf_counter
 
-from circuit2_electric_boogaloo import ALL_PARTIES, CIRCUIT, N_PARTIES, PRIVATE_VALUES
-from config  import LOCAL, MAX_TIME, PKILL_PATTERN, REPEATABLE_RANDOM_NUMBERS
+from circuit2_electric_boogaloo import ALL_PARTIES, CIRCUIT, DEGREE, FUNCTION_RESULT, N_PARTIES, PRIVATE_VALUES
+from config  import ENDPOINT, LOCAL, MAX_TIME, PACKING, PKILL_PATTERN, REPEATABLE_RANDOM_NUMBERS, RUNTIME
 from log     import init_logging
-from party2_electric_boogaloo   import bgw_protocol
+from modprime import seed
+from party2_electric_boogaloo   import PLAN, bgw_protocol
 from network import Network
-
-# from local import simulate_parties
+from local   import simulate_parties
+from packed  import INSTANCES, RESULTS, packed_protocol
+import recombination
 
 # ---------------------------------------------------------------------------
 
-def main():
+def main(runtime):
   print(f'CIRCUIT {CIRCUIT}')
+  if ENDPOINT == 'inproc':
+    sys.exit("ENDPOINT = 'inproc' needs parties in one process, set LOCAL = True")
+  start = time.perf_counter()
+
+  # recombination vectors for output and for every resharing committee
+  # (party2_electric_boogaloo.resharing_committee) and the circuit's plan,
+  # shared by parties
+  recombination.precompute([DEGREE + 1, 2*DEGREE + 1], N_PARTIES)
+  recombination.save()
+  PLAN.save()
 
-  # create MPC party processes
-  parties = {}
+  # create MPC party processes, each reports its result on its own pipe
+  parties, pipes = {}, selectors.DefaultSelector()
   for p in ALL_PARTIES:	# to randomise Popens use 'for' on next line instead
   # for p in random.sample(ALL_PARTIES, k=N_PARTIES):
-    parties[p] = subprocess.Popen(['python3','mpc.py', str(p), PKILL_PATTERN],
-                 bufsize=1, text=True)   # line buffered text output
+    read_fd, write_fd = os.pipe()
+    parties[p] = subprocess.Popen(
+                 ['python3','mpc.py', str(p), str(write_fd), runtime, PKILL_PATTERN],
+                 bufsize=1, text=True,   # line buffered text output
+                 pass_fds=(write_fd,))
+    os.close(write_fd)
+    pipes.register(os.fdopen(read_fd), selectors.EVENT_READ, p)
+
+  # collect results as parties finish, max_time only bounds a hung run
+  results = {}
+  deadline = start + MAX_TIME
+  while pipes.get_map() and time.perf_counter() < deadline:
+    for key, _ in pipes.select(timeout=deadline - time.perf_counter()):
+      line = key.fileobj.readline()
+      if line:
+        result, wall_time = line.split()
+        result = [int(r) for r in result.split(',')]
+        results[key.data] = (result if PACKING > 1 else result[0], float(wall_time))
+      pipes.unregister(key.fileobj)
+      key.fileobj.close()
+  elapsed = time.perf_counter() - start
+
+  # politely terminate any remaining processes (sends SIGTERM signal)
+  for p in ALL_PARTIES:
+    if parties[p].poll() is None:
+      parties[p].terminate()
+    parties[p].wait()
+
+  report(results, elapsed)
 
-  # politely terminate all processes after max_time (sends SIGTERM signal)
-  time.sleep(MAX_TIME)
+def report(results, elapsed):
+  # print {party: (result, wall time)} checked against the true result, the
+  # list of results of every instance if they were packed
+  expected = RESULTS if PACKING > 1 and LOCAL != 'vectorized' else FUNCTION_RESULT
   for p in ALL_PARTIES:
-    parties[p].terminate()
+    if p not in results:
+      print(f'Party {p:02}: no result after {MAX_TIME}s')
+    else:
+      result, wall_time = results[p]
+      check = 'ok' if result == expected else f'expected {expected}'
+      print(f'Party {p:02}: result {result} in {wall_time:.3f}s {check}')
+  correct = sum(1 for (result, _) in results.values() if result == expected)
+  print(f'{correct}/{N_PARTIES} parties correct in {elapsed:.3f}s')
 
 # ---------------------------------------------------------------------------
 
 if LOCAL:
-  # optional - code for non-distributed circuit evaluation
-  # simulate_parties()
-  pass
-elif len(sys.argv) > 1:
-  # code for MPC party process
+  # non-distributed circuit evaluation, all parties in this process
+  print(f'CIRCUIT {CIRCUIT}')
+  start = time.perf_counter()
+  results = simulate_parties()
+  report(results, time.perf_counter() - start)
+elif len(sys.argv) > 2:
+  # code for MPC party process, mpc.py party_no result_fd runtime
+  start = time.perf_counter()
   party_no = int(sys.argv[1])
+  result_pipe = os.fdopen(int(sys.argv[2]), 'w')
 
   if REPEATABLE_RANDOM_NUMBERS:
-    random.seed(party_no)
+    seed(party_no)
+
+  if PACKING > 1:
+    init_logging(party_no)
+    network = Network(party_no)
+    result = packed_protocol(party_no, [i[party_no] for i in INSTANCES], network)
+    result = ','.join(map(str, result))
+  elif sys.argv[3] == 'dataflow':
+    # imported here, asyncio adds to the start up time of every party
+    import dataflow
+    result = dataflow.run(party_no, PRIVATE_VALUES[party_no])
+  else:
+    init_logging(party_no)
+    network = Network(party_no)
+    result = bgw_protocol(party_no, PRIVATE_VALUES[party_no], network)
 
-  init_logging(party_no)
-  network = Network(party_no)
-  bgw_protocol(party_no, PRIVATE_VALUES[party_no], network)
+  # report result and wall time to top-level process
+  result_pipe.write(f'{result} {time.perf_counter() - start}\n')
+  result_pipe.close()
 
 else:
-  # code for top-level process - creates and terminates MPC parties
-  main()
+  # code for top-level process - creates MPC parties and collects results,
+  # mpc.py [sync|dataflow] overrides RUNTIME
+  main(sys.argv[1] if len(sys.argv) > 1 else RUNTIME)
 
 
@@ -1,83 +1,276 @@
 # secure multi-party computation, semi-honest case, distributed, v1
 # naranker dulay, dept of computing, imperial college, october 2020
 
-import collections # deque    # could use a list
-import time   # sleep
+import collections # deque, OrderedDict    # could use a list
+import os         # path
+import tempfile   # gettempdir
+import threading  # Thread, Condition
 import zmq    # Context
 
-from circuit2_electric_boogaloo import N_GATES, ALL_PARTIES
-from config  import LOCAL_PORT, SYNC_DELAY
+import wire   # encode, decode
+from circuit2_electric_boogaloo import N_PARTIES, ALL_PARTIES
+from config  import LOCAL_PORT, READY_INTERVAL, TRANSPORT, ENDPOINT, SEND_HWM, RECEIVE_HWM, SEND_BUFFER, RECEIVE_BUFFER
+
+# gate numbers start at 1, gate 0 carries readiness messages {0: ready}
+READY_GATE = 0
+
+# ended sessions remembered so their late shares are dropped, the oldest are
+# forgotten first - late shares only trail a session by a round or so
+ENDED_SESSIONS = 1000
 
 # ---------------------------------------------------------------------------
+# transports - a sender with send(dest, msg) and a receiver with poll,
+# queued and receive. TRANSPORT selects PUB/SUB (every party subscribes to
+# every other party's publisher) or DEALER/ROUTER (a DEALER per destination
+# connected to that party's ROUTER). PUB drops messages at its high water
+# mark, a DEALER blocks the sender until the destination catches up
+
+def endpoint(party_no, bind):
+  # address of party's receiving (ROUTER) or sending (PUB) socket
+  if ENDPOINT == 'ipc':
+    path = os.path.join(tempfile.gettempdir(), f'mpc-{LOCAL_PORT+party_no}')
+    return f'ipc://{path}'
+  if ENDPOINT == 'inproc':   # parties must be threads sharing the context
+    return f'inproc://mpc-{LOCAL_PORT+party_no}'
+  host = '*' if bind else 'localhost'
+  return f'tcp://{host}:{LOCAL_PORT+party_no}'
+
+def socket(kind, context=None):
+  # new socket of kind with the configured high water marks and buffers
+  sock = (context or zmq.Context.instance()).socket(kind)
+  sock.setsockopt(zmq.SNDHWM, SEND_HWM)
+  sock.setsockopt(zmq.RCVHWM, RECEIVE_HWM)
+  if SEND_BUFFER is not None:
+    sock.setsockopt(zmq.SNDBUF, SEND_BUFFER)
+  if RECEIVE_BUFFER is not None:
+    sock.setsockopt(zmq.RCVBUF, RECEIVE_BUFFER)
+  # zmq keeps retrying connects until the other party has bound its port
+  sock.setsockopt(zmq.RECONNECT_IVL, READY_INTERVAL)
+  return sock
 
 class Publisher():
   def __init__(self, party_no):
     self.party_no = party_no
-    self.socket = zmq.Context().socket(zmq.PUB)
-    self.socket.bind(f'tcp://*:{LOCAL_PORT+party_no}')
+    self.socket = socket(zmq.PUB)
+    self.socket.bind(endpoint(party_no, bind=True))
 
-  def send(self, dest, msg):
-    # send message (pickled object) to destination party
-    self.socket.send_string(f'{dest:02}', flags=zmq.SNDMORE)
-    self.socket.send_pyobj(self.party_no, flags=zmq.SNDMORE)
-    self.socket.send_pyobj(msg)
+  def send(self, dest, msg, session=0):
+    # send message {gate: share} to destination party as a single frame
+    # starting with the destination topic (wire.py)
+    self.socket.send(wire.encode(dest, self.party_no, msg, session), copy=False)
 
 class Subscriber():
   def __init__(self, party_no):
     self.party_no = party_no
-    self.socket = zmq.Context().socket(zmq.SUB)
-    self.socket.setsockopt_string(zmq.SUBSCRIBE, f'{party_no:02}')
+    self.socket = socket(zmq.SUB)
+    self.socket.setsockopt(zmq.SUBSCRIBE, wire.topic(party_no))
     self.queues = {p: collections.deque() for p in ALL_PARTIES}
     for p in ALL_PARTIES:
-       self.socket.connect(f'tcp://localhost:{LOCAL_PORT+p}')
+       self.socket.connect(endpoint(p, bind=False))
+
+  def recv_frame(self):
+    return self.socket.recv(copy=False).buffer
 
-  def receive(self, sender):
-    # return next message from sender, keep receiving messages until 
-    # match, queue any messages from other senders
-    if self.queues[sender]:
-      return self.queues[sender].popleft()
+  def poll(self, timeout):
+    # return [(sender, ready)] for readiness messages received within timeout
+    # (ms), queue any share messages
+    readiness = []
+    while self.socket.poll(timeout):
+      msg_sender, session, msg = wire.decode(self.recv_frame())
+      if READY_GATE in msg:
+        readiness.append((msg_sender, msg[READY_GATE]))
+      else:
+        self.queues[msg_sender].append((session, msg))
+      timeout = 0
+    return readiness
+
+  def queued(self):
+    # return and clear [(sender, session, message)] queued by poll
+    messages = [(p, session, msg) for (p, queue) in self.queues.items()
+                for (session, msg) in queue]
+    for queue in self.queues.values():
+      queue.clear()
+    return messages
+
+  def receive(self):
+    # return (sender, session, message) for the next share message from any
+    # sender
     while True:
-      _our_party_no = self.socket.recv_string()
-      msg_sender = self.socket.recv_pyobj()
-      msg = self.socket.recv_pyobj()
-      if msg_sender == sender:
-        return msg
-      self.queues[msg_sender].append(msg)
+      msg_sender, session, msg = wire.decode(self.recv_frame())
+      if READY_GATE not in msg:
+        return msg_sender, session, msg
+      # late readiness message, handshake already complete
+
+class Dealer():
+  def __init__(self, party_no):
+    self.party_no = party_no
+    self.sockets = {}
+    for p in ALL_PARTIES:
+      self.sockets[p] = socket(zmq.DEALER)
+      self.sockets[p].connect(endpoint(p, bind=False))
+
+  def send(self, dest, msg, session=0):
+    # send message {gate: share} to destination party's ROUTER, blocks
+    # while SEND_HWM messages to it are queued (backpressure, not drops)
+    self.sockets[dest].send(wire.encode(dest, self.party_no, msg, session), copy=False)
+
+class Router(Subscriber):
+  # receives from every party's DEALER, the same interface as Subscriber
+  def __init__(self, party_no):
+    self.party_no = party_no
+    self.socket = socket(zmq.ROUTER)
+    self.socket.bind(endpoint(party_no, bind=True))
+    self.queues = {p: collections.deque() for p in ALL_PARTIES}
+
+  def recv_frame(self):
+    # frames are [dealer identity, message], sender is in the message
+    _identity, frame = self.socket.recv_multipart(copy=False)
+    return frame.buffer
+
+TRANSPORTS = {'pubsub': (Publisher, Subscriber), 'router': (Dealer, Router)}
 
 # ---------------------------------------------------------------------------
 
 class Network():
-  # networking - for sending and receiving shares between parties
+  # networking - for sending and receiving shares between parties. shares
+  # belong to a session, an evaluation of a circuit, so several evaluations
+  # can share the sockets at once. the methods use session 0, a Session from
+  # session() has the same methods for another session
 
   def __init__(self, party_no):
-    # create party's TCP port
-    self.publisher = Publisher(party_no)
-    # wait for all party processes/TCP ports to be created
-    time.sleep(SYNC_DELAY)
-    # connect to other parties TCP ports
-    self.subscriber = Subscriber(party_no)
-    # wait for other parties to connect to this party
-    time.sleep(1)
-    # create buffer for received shares
-    self.shares = {p: {g: None for g in range(1, N_GATES+2)}
-                   for p in ALL_PARTIES}
+    self.party_no = party_no
+    sender, receiver = TRANSPORTS[TRANSPORT]
+    # create party's sending socket(s), sessions may send from their own
+    # threads but zmq sockets must only be used by one at a time
+    self.publisher = sender(party_no)
+    self.send_lock = threading.Lock()
+    # create party's receiving socket, connected to other parties
+    self.subscriber = receiver(party_no)
+    # wait until all parties are connected to each other
+    self.wait_until_ready()
+    # mailbox of received shares {(session, party, gate): share}, filled by
+    # a background thread that drains the subscriber socket while the party
+    # computes. shares are removed from the mailbox once received
+    self.condition = threading.Condition()
+    self.mailbox = {}
+    # (session, gate)s already received from a quorum and the most recent
+    # sessions that have ended, late shares for them are dropped
+    self.closed_gates = set()
+    self.ended_sessions = collections.OrderedDict()
+    for sender, session, msg in self.subscriber.queued():
+      self.store(sender, session, msg)
+    self.receiver = threading.Thread(target=self.receive_forever, daemon=True)
+    self.receiver.start()
 
-  def send_share(self, share, src_gate, dest_party):
+  def wait_until_ready(self):
+    # readiness handshake - every READY_INTERVAL ms announce to all parties
+    # whether we have heard from all of them yet. once we have heard from
+    # everyone and everyone has said so, all subscriptions are live and no
+    # share can be dropped by PUB. keep announcing until we have sent at least
+    # one ready announcement ourselves, so no party is left waiting for it
+    heard, ready = set(), set()
+    announced = False
+    while not (announced and len(ready) == N_PARTIES):
+      is_ready = len(heard) == N_PARTIES
+      for dest_party in ALL_PARTIES:
+        self.publisher.send(dest=dest_party, msg={READY_GATE: int(is_ready)})
+      announced = is_ready
+      for sender, sender_ready in self.subscriber.poll(READY_INTERVAL):
+        heard.add(sender)
+        if sender_ready:
+          ready.add(sender)
+
+  def session(self, session):
+    # view of the network for one session (numbered from 1, 0 is the
+    # network's own), with the same methods as Network
+    return Session(self, session)
+
+  def end_session(self, session):
+    # drop the session's remaining shares and any that arrive later
+    with self.condition:
+      self.ended_sessions[session] = None
+      if len(self.ended_sessions) > ENDED_SESSIONS:
+        self.ended_sessions.popitem(last=False)
+      for key in [k for k in self.mailbox if k[0] == session]:
+        del self.mailbox[key]
+      self.closed_gates = {c for c in self.closed_gates if c[0] != session}
+
+  def send_share(self, share, src_gate, dest_party, session=0):
     # send share for gate to destination party
     # print(f"    Sending {share} from {self.publisher.party_no} to {dest_party} (gate {src_gate})")
-    self.publisher.send(dest=dest_party, msg=(src_gate,share))
+    self.send_shares(dest_party, {src_gate: share}, session)
 
-  def receive_share(self, src_party, src_gate):
-    # return share from (party:gate), keep receiving shares until 
-    # match, save any shares received from other (party:gate)'s
-    if self.shares[src_party][src_gate] is not None:
-      return self.shares[src_party][src_gate]
+  def send_shares(self, dest_party, shares, session=0):
+    # send shares for several gates {gate: share} to destination party as a
+    # single message
+    with self.send_lock:
+      self.publisher.send(dest=dest_party, msg=shares, session=session)
+
+  def receive_forever(self):
+    # receiver thread - the only user of the subscriber socket once the
+    # readiness handshake is over
+    while True:
+      sender, session, msg = self.subscriber.receive()
+      with self.condition:
+        self.store(sender, session, msg)
+        self.condition.notify_all()
+
+  def store(self, src_party, session, shares):
+    # save received shares, except late ones for gates with a quorum
+    if session in self.ended_sessions:
+      return
+    for gate, share in shares.items():
+      if (session, gate) not in self.closed_gates:
+        self.mailbox[(session, src_party, gate)] = share
 
-    while True:   # could use recursion instead
-      msg_gate, msg_share = self.subscriber.receive(src_party)
-      self.shares[src_party][msg_gate] = msg_share
-      if self.shares[src_party][src_gate] is not None:
-        # print(f"    Receiving {self.shares[src_party][src_gate]} from {src_party} to {self.publisher.party_no} (gate {src_gate})")
-        return self.shares[src_party][src_gate]
+  def receive_share(self, src_party, src_gate, session=0):
+    # return share from (party:gate), waiting until it arrives
+    return self.receive_shares(src_party, [src_gate], session)[src_gate]
+
+  def receive_shares(self, src_party, src_gates, session=0):
+    # return {gate: share} from party for all the given gates
+    with self.condition:
+      self.condition.wait_for(
+        lambda: all((session, src_party, g) in self.mailbox for g in src_gates))
+      return {g: self.mailbox.pop((session, src_party, g)) for g in src_gates}
+
+  def receive_quorum(self, src_gate, quorum, timeout=None, session=0):
+    # return {party: share} for gate from the first quorum parties to send
+    # it, in whatever order they arrive. raises TimeoutError if the quorum
+    # is not reached within timeout seconds. shares from the remaining
+    # parties are dropped, now or when they arrive
+    arrived = []
+    def reached():
+      arrived.extend(p for p in ALL_PARTIES
+                     if (session, p, src_gate) in self.mailbox and p not in arrived)
+      return len(arrived) >= quorum
+    with self.condition:
+      if not self.condition.wait_for(reached, timeout):
+        raise TimeoutError(f"Only {len(arrived)}/{quorum} shares for gate {src_gate}")
+      self.closed_gates.add((session, src_gate))
+      shares = {p: self.mailbox.pop((session, p, src_gate)) for p in arrived}
+    return dict(list(shares.items())[:quorum])
+
+class Session():
+  # a Network's methods for one session, what bgw_protocol and the other
+  # protocols are given in place of a Network
+
+  def __init__(self, network, session):
+    self.network = network
+    self.party_no = network.party_no
+    self.session = session
+
+  def send_share(self, share, src_gate, dest_party):
+    self.network.send_share(share, src_gate, dest_party, self.session)
+
+  def send_shares(self, dest_party, shares):
+    self.network.send_shares(dest_party, shares, self.session)
+
+  def receive_share(self, src_party, src_gate):
+    return self.network.receive_share(src_party, src_gate, self.session)
 
+  def receive_shares(self, src_party, src_gates):
+    return self.network.receive_shares(src_party, src_gates, self.session)
 
+  def receive_quorum(self, src_gate, quorum, timeout=None):
+    return self.network.receive_quorum(src_gate, quorum, timeout, self.session)
@@ -0,0 +1,115 @@
+# packed secret sharing - PACKING instances of the circuit, each with its own
+# inputs, evaluated in one pass over the gates
+#
+# a packed sharing holds k = PACKING secrets in one polynomial f of degree
+# DEGREE, secret j at the point -j (mod prime) and party p's share at p.
+# shares of the k instances of a wire travel as one share, so every message
+# of bgw_protocol carries k values for the price of one:
+#   - ADD, CMUL and CADD gates act on all k secrets at once
+#   - MUL/DOT gates are reduced by the resharing committee S, every member i
+#     reshares the k values r_i(-j) * h(i), its product share h(i) weighted
+#     by its recombination coefficient for point -j, as one packed sharing.
+#     the sum of the committee's sharings is a packed sharing of the k
+#     products, since sum(r_i(-j) * h(i)) over S is h(-j)
+#   - the output is recombined at each of the k points
+# the price is privacy, k secrets in a polynomial of degree DEGREE are only
+# hidden from coalitions of up to DEGREE-k+1 parties rather than DEGREE
+
+from circuit2_electric_boogaloo import ALL_PARTIES, DEGREE, MUL, DOT, N_PARTIES, PRIME, PRIVATE_VALUES, function
+from config   import PACKING, ROUND_TIMEOUT
+from log      import init_logging, write, debug
+from modprime import randints, mul, summation, matrix, to_list, matmul
+from party2_electric_boogaloo import PLAN, OUTPUT_GATE, evaluate_local, resharing_committee
+import recombination
+
+assert 1 <= PACKING <= DEGREE, "Packing needs 1 <= PACKING <= DEGREE :-("
+assert PRIME > N_PARTIES + PACKING, "Prime > N + PACKING failed :-("
+
+# ---------------------------------------------------------------------------
+
+# points holding the secrets, then points fixing the rest of the polynomial
+# at random
+SLOTS = [(-j) % PRIME for j in range(PACKING)]
+POINTS = SLOTS + list(range(1, DEGREE + 2 - PACKING))
+
+# row p-1 gives party p's share from the polynomial's values at POINTS
+SHARING = matrix([[recombination.recombination_vector(POINTS, at=p)[x] for x in POINTS]
+                  for p in ALL_PARTIES])
+
+# instance j's inputs are PRIVATE_VALUES shifted by j
+INSTANCES = [{p: (v + j) % PRIME for (p, v) in PRIVATE_VALUES.items()}
+             for j in range(PACKING)]
+RESULTS = [function(instance) for instance in INSTANCES]
+
+def share_packed(vectors):
+  # one packed sharing per vector of PACKING secrets, returns {party: [shares]}
+  k = len(vectors)
+  randoms = randints(k * (len(POINTS) - PACKING))
+  values = [[v[j] for v in vectors] for j in range(PACKING)] + \
+           [randoms[i*k:(i+1)*k] for i in range(len(POINTS) - PACKING)]
+  shares = to_list(matmul(SHARING, matrix(values)))
+  return dict(zip(ALL_PARTIES, shares))
+
+def open_packed(shares):
+  # return the PACKING secrets of {party: share} from DEGREE+1 or more parties
+  secrets = []
+  for slot in SLOTS:
+    recombination_vector = recombination.recombination_vector(shares, at=slot)
+    secrets.append(summation([shares[p] * recombination_vector[p] for p in shares]))
+  return secrets
+
+# ---------------------------------------------------------------------------
+
+def packed_protocol(party_no, private_values, network):
+  # bgw_protocol for PACKING instances, private_values has the party's input
+  # for each instance. returns the list of results
+  init_logging(party_no)
+
+  # split private inputs, one packed share per party
+  if party_no <= PLAN.n_inputs:
+    shares = share_packed([private_values])
+    for dest_party in ALL_PARTIES:
+      network.send_share(shares[dest_party][0], party_no, dest_party)
+  shares = {p: network.receive_share(p, p) for p in range(1, PLAN.n_inputs + 1)}
+
+  # evaluate circuit, as bgw_step_two
+  values = {}
+  for step, gates in PLAN.steps():
+    if PLAN.kind[gates[0]] in (MUL, DOT):
+      operands = {key: [values[i] for i in PLAN.gate_inputs(key)] for key in gates}
+      values.update(multiply(network, operands))
+    else:
+      key = gates[0]
+      values[key] = evaluate_local(key, shares, values)
+    for key in PLAN.released(step):
+      del values[key]
+  result = values[PLAN.gate_inputs(OUTPUT_GATE)[0]]
+
+  # broadcast output share and open every instance from the first T+1
+  for dest_party in ALL_PARTIES:
+    network.send_share(result, OUTPUT_GATE, dest_party)
+  outputs = network.receive_quorum(OUTPUT_GATE, DEGREE + 1, ROUND_TIMEOUT)
+  results = open_packed(outputs)
+  write(f"Final results are {results}")
+  return results
+
+def multiply(network, operands):
+  # degree reduction of a layer of MUL/DOT gates for all instances at once
+  committee = resharing_committee(operands)
+  if network.party_no in committee:
+    weights = [recombination.recombination_vector(committee, at=slot)[network.party_no]
+               for slot in SLOTS]
+    vectors = []
+    for inputs in operands.values():
+      product = summation([mul(a, b) for (a, b) in zip(inputs[0::2], inputs[1::2])])
+      vectors.append([mul(w, product) for w in weights])
+    shares = share_packed(vectors)
+    for dest_party in ALL_PARTIES:
+      network.send_shares(dest_party, dict(zip(operands, shares[dest_party])))
+    debug(f"Reshared gates {list(operands)} for {PACKING} instances")
+
+  received = {p: network.receive_shares(p, list(operands)) for p in committee}
+  return {
+    src_gate: summation([received[p][src_gate] for p in committee])
+    for src_gate in operands
+  }
@@ -2,6 +2,7 @@ import random
 
 from circuit import N_PARTIES, PRIME, DEGREE, GATES, ADD, INP, MUL, ZER
 from modprime import add, mul
+from recombination import recombination_vector
 
 def bgw_protocol(party_no, private_value, network):
     # Phase 1: Shamir Secret Sharing
@@ -30,16 +31,9 @@ def bgw_protocol(party_no, private_value, network):
     print("Output: " + secret + " computed at party " + party_no)
 
 def recombination(values, degree, party_no = None):
-    deltas = [0]
-    for i in range(1, degree + 2):
-        count = 1
-        for j in range(1, degree + 2):
-            if i == j:
-                continue
-            count = count * j / (j-i)
-        # Convert value to integer to prevent floating point issue
-        count = int(count)
-        deltas.append(count)
+    # Exact modular lagrange coefficients for parties 1..degree+1
+    vector = recombination_vector(range(1, degree + 2), PRIME)
+    deltas = [0] + [vector[i] for i in range(1, degree + 2)]
     count = 0
     for i in range(1, degree + 2):
         count += (values[i] * deltas[i])
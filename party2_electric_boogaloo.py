@@ -1,41 +1,87 @@
 # Written by Matthew Pull (mp1816) and Alvin Lee (aml1817)
-import random
+import functools
 
 from log import init_logging, write, debug
-from modprime import randint, add, mul, div
-from circuit2_electric_boogaloo import GATES, N_PARTIES, ALL_PARTIES, INP, ADD, MUL, PRIME, DEGREE
+from modprime import randints, seed, add, sub, mul, summation, vector, matrix, to_list, matmul
+from circuit2_electric_boogaloo import GATES, N_PARTIES, ALL_PARTIES, INP, ADD, MUL, CMUL, CADD, DOT, PRIME, DEGREE
+from config import ROUND_TIMEOUT, DEGREE_REDUCTION
+from plan import Plan
+import recombination
 
-OUTPUT_GATE = len(GATES) + 1
-N_INPUTS = sum([1 for (gate_type, _, _) in GATES.values() if gate_type == INP])
-RECOMBINATION_VECTOR_CACHE = {}
+# Compiled plan saved by the launcher, if any and for the same GATES
+PLAN = Plan.load(GATES)
+OUTPUT_GATE = PLAN.output_gate
+N_INPUTS = PLAN.n_inputs
 NO_RANDOM = False
 
+# Recombination vectors precomputed by the launcher, if any
+recombination.load()
 
-def bgw_protocol(party_no, private_value, network):
+# Gate numbers after the output gate carry the offline phase's shares
+PREPROCESSING_GATE = OUTPUT_GATE + 1
+
+# Each round of the offline phase extracts N-T random values from the N
+# parties' contributions, row k is [1^k, 2^k .. N^k] (mod prime). Any N-T
+# columns form an invertible matrix, so the values are random as long as
+# N-T parties are honest
+EXTRACTED = N_PARTIES - DEGREE
+EXTRACTOR = matrix([[pow(p, k, PRIME) for p in ALL_PARTIES] for k in range(EXTRACTED)])
+
+
+# With DEGREE_REDUCTION 'open' or 'king' the double sharings can be made in
+# advance by offline_phase (e.g. in a session of their own while idle) and
+# passed in, otherwise they are made here before the inputs are shared. Each
+# set of double sharings must only be used for one evaluation
+def bgw_protocol(party_no, private_value, network, double_sharings=None):
     if NO_RANDOM:
         # Force a known set of "random" numbers for debug purposes
-        random.seed(party_no)
+        seed(party_no)
     init_logging(party_no)
+    if DEGREE_REDUCTION != 'bgw' and double_sharings is None:
+        double_sharings = offline_phase(network)
     initial_shares = bgw_step_one(party_no, network, private_value) 
-    circuit_result = bgw_step_two(network, initial_shares)
+    circuit_result = bgw_step_two(network, initial_shares, double_sharings)
     result = bgw_step_three(network, circuit_result)
     write(f"Final result is {result}")
+    return result
+
+
+# Offline Phase - Random double sharings, the same random value shared with
+# degree T and degree 2T, for every MUL/DOT gate. Needs no inputs so can be
+# run before they are known, in any session as long as all parties run it
+# in the same one. Returns {gate: (degree T share, degree 2T share)}
+def offline_phase(network):
+    gates = [g for g in range(1, PLAN.n_gates + 1) if PLAN.kind[g] in (MUL, DOT)]
+    if not gates:
+        return {}
+    rounds = -(-len(gates) // EXTRACTED)
+
+    # Contribute one random value per round, shared at both degrees
+    contributions = randints(rounds)
+    low = share_secrets(contributions)
+    high = share_secrets(contributions, 2*DEGREE)
+    src_gates = list(range(PREPROCESSING_GATE, PREPROCESSING_GATE + 2*rounds))
+    for dest_party in ALL_PARTIES:
+        shares = [share for pair in zip(low[dest_party], high[dest_party]) for share in pair]
+        network.send_shares(dest_party, dict(zip(src_gates, shares)))
+
+    # Extract N-T double sharings per round from all parties' contributions
+    received = [network.receive_shares(p, src_gates) for p in ALL_PARTIES]
+    low = to_list(matmul(EXTRACTOR, matrix([[r[g] for g in src_gates[0::2]] for r in received])))
+    high = to_list(matmul(EXTRACTOR, matrix([[r[g] for g in src_gates[1::2]] for r in received])))
+    pairs = [(low[k][i], high[k][i]) for i in range(rounds) for k in range(EXTRACTED)]
+    debug(f"Preprocessed {len(gates)} double sharings in {rounds} rounds")
+    return dict(zip(gates, pairs))
 
 
 # Step One - Distribute private inputs & split shares
 def bgw_step_one(party_no, network, private_value):
-    # Generate random polynomial
-    local_coeff = [private_value] + [randint() for _ in range(DEGREE)]
-    debug(f"Polynomial coefficients (ascending powers of x): {local_coeff}")
-    
     # Split private inputs
     if (party_no <= N_INPUTS):
-        shares = []
+        shares = share_secrets([private_value])
         for dest_party in ALL_PARTIES:
-            share = calc_poly(dest_party, local_coeff)
-            shares.append(share)
-            network.send_share(share, party_no, dest_party)
-        debug(f"Calculated shares: {shares}")
+            network.send_share(shares[dest_party][0], party_no, dest_party)
+        debug(f"Calculated shares: {[shares[p][0] for p in ALL_PARTIES]}")
     
     # Distribute shares
     shares = {
@@ -47,95 +93,241 @@ def bgw_step_one(party_no, network, private_value):
     return shares
 
 
-# Step Two - Evaluate circuit
-def bgw_step_two(network, shares):
-    results = {}
-    for key, (gate_type, output_gate, order) in GATES.items():
-        if not output_gate in results:
-            results[output_gate] = {1: None, 2: None}
-        if gate_type == INP:
-            results[output_gate][order] = shares[key]
-        elif gate_type == ADD:
-            add_result = add(results[key][1], results[key][2])
-            results[output_gate][order] = add_result
-            debug(f"Calculating gate {key} (ADD): {results[key][1]} + {results[key][2]} (mod {PRIME}) = {add_result}")
-        elif gate_type == MUL:
-            results[output_gate][order] = multiply(network, results[key][1], results[key][2], key)
+# Step Two - Evaluate circuit, one communication round per layer of MUL gates.
+# Each value is dropped as soon as the last gate reading it has been evaluated
+def bgw_step_two(network, shares, double_sharings=None):
+    values = {}
+    for step, gates in PLAN.steps():
+        if PLAN.kind[gates[0]] in (MUL, DOT):
+            # Reshare every MUL/DOT gate in the layer together
+            operands = {key: [values[i] for i in PLAN.gate_inputs(key)] for key in gates}
+            values.update(multiply(network, operands, double_sharings))
         else:
-            write(f"Error. Unable to evaluate {gate_type} in key {key}")
-    return results[OUTPUT_GATE][1]
+            key = gates[0]
+            values[key] = evaluate_local(key, shares, values)
+        for key in PLAN.released(step):
+            del values[key]
+    return values[PLAN.gate_inputs(OUTPUT_GATE)[0]]
+
+
+# Evaluate a gate that needs no communication
+def evaluate_local(key, shares, values):
+    gate_type = PLAN.kind[key]
+    inputs = [values[i] for i in PLAN.gate_inputs(key)]
+    if gate_type == INP:
+        return shares.pop(key)
+    elif gate_type == ADD:
+        # Any number of inputs can be added locally
+        add_result = summation(inputs)
+        debug(f"Calculating gate {key} (ADD): {' + '.join(map(str, inputs))} (mod {PRIME}) = {add_result}")
+        return add_result
+    elif gate_type == CMUL:
+        # Multiplying by a public constant keeps the degree, no resharing
+        constant = PLAN.constant[key]
+        mul_result = mul(inputs[0], constant)
+        debug(f"Calculating gate {key} (CMUL): {inputs[0]} x {constant} (mod {PRIME}) = {mul_result}")
+        return mul_result
+    elif gate_type == CADD:
+        # Every party adds the constant, shifting the secret by it
+        constant = PLAN.constant[key]
+        add_result = add(inputs[0], constant)
+        debug(f"Calculating gate {key} (CADD): {inputs[0]} + {constant} (mod {PRIME}) = {add_result}")
+        return add_result
+    write(f"Error. Unable to evaluate {gate_type} in key {key}")
 
 
 # Step Three - Broadcast outputs & combine outputs
 def bgw_step_three(network, result):
+    if DEGREE_REDUCTION == 'king':
+        return open_by_king(network, OUTPUT_GATE, result, DEGREE + 1)
+
     # Broadcast output
     for dest_party in ALL_PARTIES:
         network.send_share(result, OUTPUT_GATE, dest_party)
     
-    # Receive outputs
-    outputs = {
-        remote_party: network.receive_share(remote_party, OUTPUT_GATE)
-        for remote_party in ALL_PARTIES
-    }
+    # Receive outputs, any T+1 shares determine the result so use whichever
+    # arrive first rather than waiting for the slowest party
+    outputs = network.receive_quorum(OUTPUT_GATE, DEGREE + 1, ROUND_TIMEOUT)
 
-    # Combine outputs
-    recombination_vector = calc_recombination_vector(DEGREE + 1) 
-    result = sum([
-        outputs[i] * recombination_vector[i]
-        for i in range(1, len(recombination_vector) + 1)
-    ]) % PRIME
+    # Combine outputs with the recombination vector for those parties
+    result = reconstruct(outputs)
 
-    debug(f"Final result {result} using rec vector {recombination_vector}")
+    debug(f"Final result {result} from parties {list(outputs)}")
     return result
 
 
-# Calculate recombination vector and cache it
+# Recombination vector for parties 1..size, from the cache loaded at startup
+# if the launcher precomputed it (recombination.py)
 def calc_recombination_vector(size):
-    if size in RECOMBINATION_VECTOR_CACHE:
-        return RECOMBINATION_VECTOR_CACHE[size]
-
-    recombination_vector = {}
-    for i in range(1, size + 1):
-        acc = 1
-        for j in [x for x in range(1, size + 1) if i != x]:
-            acc = mul(acc, div(j, j-i))
-        recombination_vector[i] = int(acc)
-    
-    RECOMBINATION_VECTOR_CACHE[size] = recombination_vector
-    return recombination_vector
+    return recombination.recombination_vector(range(1, size + 1))
+
+# The 2T+1 parties that reshare a layer of MUL/DOT gates. Every party must
+# recombine the same parties' shares (or the new shares would lie on different
+# polynomials), so the committee is fixed by the gates rather than by arrival
+# order. It rotates round the parties from layer to layer, spreading the work
+# and meaning a slow party only holds up the layers it is on the committee of
+def resharing_committee(gates):
+    start = min(gates) % N_PARTIES
+    return [(start + i) % N_PARTIES + 1 for i in range(2*DEGREE + 1)]
 
-# Calculate Poly(x)
+# Calculate Poly(x) using Horner's rule
 def calc_poly(x, coeff):
-    return sum([coeff[i] * (x ** i) for i in range(len(coeff))]) % PRIME
+    result = 0
+    for c in reversed(coeff):
+        result = (result * x + c) % PRIME
+    return result
 
 
-# Runs the multiplication protocol with sharing
-def multiply(network, a, b, src_gate):
-    # Begin with locally computing (a x b) % prime
-    private_value = mul(a, b)
-    debug(f"Calculating gate {src_gate} (MUL): {a} x {b} (mod {PRIME}) = {private_value}")
+# Powers of the party numbers, row p-1 is [1, p, p^2 .. p^degree] (mod prime)
+@functools.lru_cache(maxsize=None)
+def vandermonde(degree):
+    return matrix([[pow(p, i, PRIME) for i in range(degree + 1)] for p in ALL_PARTIES])
 
-    # Party produces a new polynomial and broadcasts it
-    local_coeff = [private_value] + [randint() for _ in range(DEGREE)]
-    debug(f"Coefficients for gate {src_gate} (MUL): {local_coeff}")
-    shares = []
-    for dest_party in ALL_PARTIES:
-        share = calc_poly(dest_party, local_coeff)
-        shares.append(share)
-        network.send_share(share, src_gate, dest_party)
-    debug(f"Calculated shares for gate {src_gate} (MUL): {shares}")
+# Share each secret with its own random polynomial, returns {party: [shares]}.
+# The coefficients of the polynomials are the columns of a (degree+1 x k)
+# matrix, so all parties' shares are the product vandermonde . coefficients.
+# The random coefficients for all k secrets (e.g. a layer of gates) are one
+# draw from the random source
+def share_secrets(secrets, degree=DEGREE):
+    k = len(secrets)
+    randoms = randints(degree * k)
+    coeff = [list(secrets)] + [randoms[i*k:(i+1)*k] for i in range(degree)]
+    debug(f"Polynomial coefficients (ascending powers of x): {list(zip(*coeff))}")
+    if len(secrets) == 1:
+        column = [c[0] for c in coeff]
+        return {p: [calc_poly(p, column)] for p in ALL_PARTIES}
+    shares = to_list(matmul(vandermonde(degree), matrix(coeff)))
+    return dict(zip(ALL_PARTIES, shares))
 
-    # Receive shares from others
-    shares = {
-        remote_party: network.receive_share(remote_party, src_gate) 
-        for remote_party in ALL_PARTIES
+
+# Runs the multiplication protocol with sharing for a layer of MUL/DOT gates,
+# operands maps each gate to its input shares [a1, b1, a2, b2, ...]. A MUL
+# gate is a DOT gate with a single pair, the degree 2T products of all pairs
+# are added locally so a DOT gate is reshared only once. Only the resharing
+# committee sends shares and only their shares are waited on. With double
+# sharings from the offline phase there is no resharing, see open_and_correct
+def multiply(network, operands, double_sharings=None):
+    committee = resharing_committee(operands)
+
+    # Begin with locally computing (a1 x b1 + a2 x b2 ...) % prime and send
+    # shares of every result before waiting on any, so the layer costs a
+    # single round
+    private_values = []
+    for src_gate, inputs in operands.items():
+        pairs = list(zip(inputs[0::2], inputs[1::2]))
+        private_value = summation([mul(a, b) for (a, b) in pairs])
+        private_values.append(private_value)
+        debug(f"Calculating gate {src_gate} (MUL): {' + '.join(f'{a} x {b}' for (a, b) in pairs)} (mod {PRIME}) = {private_value}")
+    if double_sharings is not None:
+        return open_and_correct(network, dict(zip(operands, private_values)), double_sharings)
+
+    if network.party_no in committee:
+        # Party produces a new polynomial per gate, shared in one matrix product
+        shares = share_secrets(private_values)
+        outgoing = {
+            dest_party: dict(zip(operands, shares[dest_party]))
+            for dest_party in ALL_PARTIES
+        }
+        debug(f"Calculated shares for gates {list(operands)} (MUL): {shares}")
+
+        # Broadcast the shares for the whole layer, one message per party
+        for dest_party in ALL_PARTIES:
+            network.send_shares(dest_party, outgoing[dest_party])
+
+    # Receive shares from the committee
+    received = {
+        remote_party: network.receive_shares(remote_party, list(operands))
+        for remote_party in committee
     }
-    debug(f"Received shares for gate {src_gate} (MUL): {list(shares.values())}")
 
-    recombination_vector = calc_recombination_vector(2*DEGREE + 1)
+    recombination_vector = recombination.recombination_vector(committee)
 
-    result = sum([
-        shares[i] * recombination_vector[i] for i in range(1, len(recombination_vector) + 1)
-    ]) % PRIME
-    debug(f"MUL gate {src_gate} result {result} using rec vector {recombination_vector}")
-    return result
+    # Recombine the whole layer at once, (gates x 2T+1 shares) . rec vector
+    rows = []
+    for src_gate in operands:
+        shares = [received[remote_party][src_gate] for remote_party in committee]
+        debug(f"Received shares for gate {src_gate} (MUL): {shares}")
+        rows.append(shares)
+    weights = vector([recombination_vector[i] for i in committee])
+    results = dict(zip(operands, to_list(matmul(matrix(rows), weights))))
+    for src_gate, result in results.items():
+        debug(f"MUL gate {src_gate} result {result} using rec vector {recombination_vector}")
+    return results
+
+
+# Online multiplication with a double sharing ([r] degree T, [r] degree 2T).
+# Every party's degree 2T share of product + r is opened, any 2T+1 of them
+# give the same public value d = product + r, so the first to arrive are
+# used. [r] of degree T is then subtracted from d, a degree T sharing of the
+# product without generating or sending any polynomials. DEGREE_REDUCTION
+# 'open' sends every share to every party (N^2 messages per gate), 'king'
+# sends them to the gate's king who opens d and sends it back (2N messages)
+def open_and_correct(network, private_values, double_sharings):
+    masked = {
+        src_gate: add(private_value, double_sharings[src_gate][1])
+        for src_gate, private_value in private_values.items()
+    }
+    if DEGREE_REDUCTION == 'king':
+        opened = open_by_kings(network, masked)
+    else:
+        for dest_party in ALL_PARTIES:
+            network.send_shares(dest_party, masked)
+        opened = {
+            src_gate: reconstruct(network.receive_quorum(src_gate, 2*DEGREE + 1, ROUND_TIMEOUT))
+            for src_gate in masked
+        }
+
+    results = {}
+    for src_gate, masked_value in opened.items():
+        low, _ = double_sharings.pop(src_gate)
+        results[src_gate] = sub(masked_value, low)
+        debug(f"MUL gate {src_gate} opened {masked_value} result {results[src_gate]}")
+    return results
+
+
+# The party that opens a gate's value in king mode, rotating across gates
+def king(src_gate):
+    return src_gate % N_PARTIES + 1
+
+# Open a layer's masked values, each gate by its own king. Each party sends
+# one message per king with the shares of that king's gates, each king one
+# message per party with the values it opened
+def open_by_kings(network, masked):
+    gates_by_king = {}
+    for src_gate, share in masked.items():
+        gates_by_king.setdefault(king(src_gate), {})[src_gate] = share
+    for king_party, shares in gates_by_king.items():
+        network.send_shares(king_party, shares)
+
+    # As king, open my gates from the first 2T+1 shares and send them back
+    opened = {
+        src_gate: reconstruct(network.receive_quorum(src_gate, 2*DEGREE + 1, ROUND_TIMEOUT))
+        for src_gate in gates_by_king.get(network.party_no, {})
+    }
+    if opened:
+        for dest_party in ALL_PARTIES:
+            if dest_party != network.party_no:
+                network.send_shares(dest_party, opened)
+
+    # Receive the other kings' values
+    for king_party, shares in gates_by_king.items():
+        if king_party != network.party_no:
+            opened.update(network.receive_shares(king_party, list(shares)))
+    return {src_gate: opened[src_gate] for src_gate in masked}
+
+# Open a single value from the first quorum of shares sent to its king
+def open_by_king(network, src_gate, share, quorum):
+    king_party = king(src_gate)
+    network.send_share(share, src_gate, king_party)
+    if network.party_no != king_party:
+        return network.receive_share(king_party, src_gate)
+    value = reconstruct(network.receive_quorum(src_gate, quorum, ROUND_TIMEOUT))
+    for dest_party in ALL_PARTIES:
+        if dest_party != king_party:
+            network.send_share(value, src_gate, dest_party)
+    return value
+
+# The secret of {party: share} for any parties (at least degree+1 of them)
+def reconstruct(shares):
+    recombination_vector = recombination.recombination_vector(shares)
+    return summation([shares[p] * recombination_vector[p] for p in shares])
@@ -0,0 +1,212 @@
+# compiled form of a GATES table - flat integer arrays for evaluating a
+# circuit, built once per party
+#
+#   kind[g], constant[g]       - gate type and CMUL/CADD constant of gate g
+#   inputs[input_start[g]:input_start[g+1]]
+#                              - gates feeding gate g, in input order
+#   layers                     - (MUL/DOT gates, local gates) per level of
+#                                multiplicative depth, MUL/DOT gates of a
+#                                layer are reshared in one round
+#   release[release_start[s]:release_start[s+1]]
+#                              - gates whose value is read for the last time
+#                                by step s and can be dropped afterwards
+#
+# gates are evaluated in steps - the MUL/DOT gates of a layer together, then
+# every local gate of the layer on its own. liveness analysis frees each
+# value after its last reader, so the values a party holds at any time are
+# bounded by the width of the circuit rather than its size
+#
+# the launcher saves the plan to PLAN_CACHE and parties memory-map it rather
+# than rebuilding it - a header (its length, then json with the content hash
+# of the GATES table, counts, CMUL/CADD constants and where each array
+# starts) followed by the arrays. the arrays of a loaded plan are
+# memoryviews of the mapped file
+
+import array     # array
+import hashlib   # sha256
+import json      # dumps, loads
+import mmap      # mmap
+import os        # replace
+import struct    # pack, unpack_from
+
+from circuit2_electric_boogaloo import INP, MUL, DOT
+from config import PLAN_CACHE
+
+# bump when the layout of saved plans changes
+PLAN_FORMAT = 1
+
+# arrays saved with a plan, each 8-byte aligned in the file
+ARRAYS = ('inputs', 'input_start', 'levels', 'layer_gates', 'layer_start',
+          'release', 'release_start', 'kind')
+
+# ---------------------------------------------------------------------------
+
+def gate_outputs(gate):
+  # return the (output_gate, order) wires a gate feeds - a gate whose value
+  # is used more than once lists all of them, e.g. (INP, (7, 9), (1, 2))
+  _, output_gate, order = gate[:3]
+  if isinstance(output_gate, tuple):
+    return list(zip(output_gate, order))
+  return [(output_gate, order)]
+
+class Plan():
+  def __init__(self, gates):
+    n_gates = len(gates)
+    assert list(gates) == list(range(1, n_gates + 1)), \
+      "Gates must be numbered 1..N in evaluation order"
+    self.n_gates = n_gates
+    self.output_gate = n_gates + 1   # (output_gate, 1) is the output wire
+
+    self.kind = array.array('b', [-1] + [gate[0] for gate in gates.values()])
+    self.constant = [None] + [gate[3] if len(gate) > 3 else None
+                              for gate in gates.values()]
+    self.n_inputs = self.kind.count(INP)
+
+    # inputs of each gate ordered by input number, as CSR arrays
+    feeds = {g: [] for g in range(1, self.output_gate + 1)}
+    for g, gate in gates.items():
+      for output_gate, order in gate_outputs(gate):
+        if output_gate in feeds:
+          feeds[output_gate].append((order, g))
+    self.input_start = array.array('q', [0, 0])
+    self.inputs = array.array('q')
+    for g in range(1, self.output_gate + 1):
+      self.inputs.extend(src for (_, src) in sorted(feeds[g]))
+      self.input_start.append(len(self.inputs))
+
+    self.levels = self.calc_levels()
+    self.layers = self.calc_layers()
+    self.calc_liveness()
+    self.key = plan_key(gates)
+    self.mapped = False
+
+  def gate_inputs(self, g):
+    return self.inputs[self.input_start[g]:self.input_start[g+1]]
+
+  def calc_levels(self):
+    # multiplicative depth of every gate - INP gates are at level 0, local
+    # gates at the level of their deepest input and MUL/DOT gates one level
+    # deeper. gates are in evaluation order so inputs are levelled first
+    levels = array.array('q', [0] * (self.n_gates + 1))
+    for g in range(1, self.n_gates + 1):
+      level = max([levels[i] for i in self.gate_inputs(g)] or [0])
+      levels[g] = level + 1 if self.kind[g] in (MUL, DOT) else level
+    return levels
+
+  def calc_layers(self):
+    # layer n holds the MUL/DOT gates at level n followed by the local gates
+    # that only depend on levels <= n
+    depth = max(self.levels)
+    layers = [(array.array('q'), array.array('q')) for _ in range(depth + 1)]
+    for g in range(1, self.n_gates + 1):
+      mul_gates, local_gates = layers[self.levels[g]]
+      (mul_gates if self.kind[g] in (MUL, DOT) else local_gates).append(g)
+    return layers
+
+  def steps(self):
+    # yield (step, gates) in evaluation order
+    step = 0
+    for mul_gates, local_gates in self.layers:
+      if mul_gates:
+        yield step, mul_gates
+        step += 1
+      for g in local_gates:
+        yield step, [g]
+        step += 1
+
+  def calc_liveness(self):
+    # last step reading each gate's value, the circuit's output gate is never
+    # released and gates nobody reads are released straight away
+    computed_at = array.array('q', [0] * (self.n_gates + 1))
+    last_read = array.array('q', [-1] * (self.n_gates + 1))
+    n_steps = 0
+    for step, gates in self.steps():
+      for g in gates:
+        computed_at[g] = step
+        for i in self.gate_inputs(g):
+          last_read[i] = max(last_read[i], step)
+      n_steps = step + 1
+    self.n_steps = n_steps
+
+    released = [[] for _ in range(n_steps)]
+    outputs = set(self.gate_inputs(self.output_gate))
+    for g in range(1, self.n_gates + 1):
+      if g in outputs:
+        continue
+      released[max(last_read[g], computed_at[g])].append(g)
+    self.release_start = array.array('q', [0])
+    self.release = array.array('q')
+    for gates in released:
+      self.release.extend(gates)
+      self.release_start.append(len(self.release))
+
+  def released(self, step):
+    return self.release[self.release_start[step]:self.release_start[step+1]]
+
+  def save(self, path=PLAN_CACHE):
+    # write the plan, unless it was loaded from path
+    if self.mapped:
+      return
+    # layers as CSR arrays too, layer n is [2n]:[2n+1] and [2n+1]:[2n+2]
+    self.layer_gates = array.array('q')
+    self.layer_start = array.array('q', [0])
+    for mul_gates, local_gates in self.layers:
+      for gates in (mul_gates, local_gates):
+        self.layer_gates.extend(gates)
+        self.layer_start.append(len(self.layer_gates))
+    arrays, offset = {}, 0
+    for name in ARRAYS:
+      values = getattr(self, name)
+      arrays[name] = (values.typecode, offset, len(values))
+      offset += -(-len(values) * values.itemsize // 8) * 8
+    header = json.dumps({
+      'key': self.key, 'n_gates': self.n_gates, 'n_inputs': self.n_inputs,
+      'n_steps': self.n_steps, 'arrays': arrays,
+      'constants': {g: c for (g, c) in enumerate(self.constant) if c is not None},
+    }).encode()
+    header += b' ' * (-len(header) % 8)
+    temp = f'{path}.{os.getpid()}'
+    with open(temp, 'wb') as file:
+      file.write(struct.pack('<Q', len(header)) + header)
+      for name in ARRAYS:
+        data = getattr(self, name).tobytes()
+        file.write(data + bytes(-len(data) % 8))
+    os.replace(temp, path)   # atomic, parties may be mapping the old one
+
+  @classmethod
+  def load(cls, gates, path=PLAN_CACHE):
+    # plan for gates mapped from path, or a new one if path has none for them
+    try:
+      with open(path, 'rb') as file:
+        data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+      size, = struct.unpack_from('<Q', data)
+      header = json.loads(data[8:8 + size])
+    except (OSError, ValueError, struct.error):
+      return cls(gates)
+    if header['key'] != plan_key(gates):
+      return cls(gates)
+
+    plan = cls.__new__(cls)
+    plan.key = header['key']
+    plan.mapped = True
+    plan.n_gates = header['n_gates']
+    plan.output_gate = plan.n_gates + 1
+    plan.n_inputs = header['n_inputs']
+    plan.n_steps = header['n_steps']
+    plan.constant = [None] * (plan.n_gates + 1)
+    for g, c in header['constants'].items():
+      plan.constant[int(g)] = c
+    start = 8 + size
+    for name, (typecode, offset, length) in header['arrays'].items():
+      view = memoryview(data)[start + offset:]
+      itemsize = array.array(typecode).itemsize
+      setattr(plan, name, view[:length * itemsize].cast(typecode))
+    bounds = plan.layer_start
+    plan.layers = [(plan.layer_gates[bounds[i]:bounds[i+1]],
+                    plan.layer_gates[bounds[i+1]:bounds[i+2]])
+                   for i in range(0, len(bounds) - 1, 2)]
+    return plan
+
+def plan_key(gates):
+  # content hash of a GATES table (and the plan format)
+  return hashlib.sha256(repr((PLAN_FORMAT, gates)).encode()).hexdigest()
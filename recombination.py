@@ -0,0 +1,76 @@
+# recombination vectors (lagrange coefficients at 0, or at another point) for
+# any subset of parties, cached in memory and on disk
+#
+# for parties P the vector is r[i] = prod(j / (j - i)) over j in P, j != i,
+# so the secret is sum(r[i] * share[i]). at point x it is
+# r[i] = prod((j - x) / (j - i)), giving the polynomial's value at x (packed
+# sharings hold secrets at points other than 0, packed.py). all the
+# denominators of a vector are inverted together with one modular inversion
+# (modprime.batch_inv). vectors are keyed by (prime, parties, point) and can
+# be saved to and loaded from RECOMBINATION_CACHE, so parties can start
+# without computing any
+
+import json      # dump, load
+import os        # replace
+
+from circuit2_electric_boogaloo import PRIME
+from config   import RECOMBINATION_CACHE
+from modprime import batch_inv
+
+# ---------------------------------------------------------------------------
+
+VECTORS = {}   # (prime, (party, ...), point): {party: r}
+
+def recombination_vector(parties, prime=PRIME, at=0):
+  # return {party: r} for the given parties (any order, no repeats)
+  key = (prime, tuple(sorted(parties)), at % prime)
+  if key not in VECTORS:
+    VECTORS[key] = calc_recombination_vector(key[1], prime, key[2])
+  return VECTORS[key]
+
+def calc_recombination_vector(parties, prime, at=0):
+  numerators, denominators = [], []
+  for i in parties:
+    numerator, denominator = 1, 1
+    for j in parties:
+      if j != i:
+        numerator = numerator * (j - at) % prime
+        denominator = denominator * (j - i) % prime
+    numerators.append(numerator)
+    denominators.append(denominator)
+  inverses = batch_inv(denominators, prime)
+  return {i: n * d % prime for (i, n, d) in zip(parties, numerators, inverses)}
+
+def precompute(sizes, n_parties, prime=PRIME):
+  # vectors for every run of size consecutive parties, wrapping round from
+  # n_parties to 1, i.e. 1..size, 2..size+1, .. and n_parties,1..size-1
+  for size in sizes:
+    if size <= n_parties:
+      for start in range(n_parties):
+        recombination_vector([(start + i) % n_parties + 1 for i in range(size)], prime)
+
+def save(path=RECOMBINATION_CACHE):
+  # write all vectors computed so far (plus any already on disk)
+  load(path)
+  cache = {}
+  for (prime, parties, at), vector in VECTORS.items():
+    entry = cache.setdefault(str(prime), {})
+    name = ','.join(map(str, parties)) + (f'@{at}' if at else '')
+    entry[name] = [vector[p] for p in parties]
+  temp = f'{path}.{os.getpid()}'
+  with open(temp, 'w') as file:
+    json.dump(cache, file)
+  os.replace(temp, path)   # atomic, parties may be loading concurrently
+
+def load(path=RECOMBINATION_CACHE):
+  # add vectors from the cache file, if there is one
+  try:
+    with open(path) as file:
+      cache = json.load(file)
+  except (OSError, ValueError):
+    return
+  for prime, entries in cache.items():
+    for name, vector in entries.items():
+      parties, _, at = name.partition('@')
+      parties = tuple(int(p) for p in parties.split(','))
+      VECTORS.setdefault((int(prime), parties, int(at or 0)), dict(zip(parties, vector)))
@@ -0,0 +1,135 @@
+# streaming evaluation - every party reads a stream of input values and the
+# circuit is evaluated once per value, as a pipeline
+#
+# evaluation i runs bgw_protocol in network session i (network.py) on a
+# thread of its own, with up to PIPELINE_DEPTH evaluations in flight, so the
+# input sharing of later evaluations overlaps the MUL layers of earlier ones.
+# results come out in input order. every party's stream must have the same
+# length, parties without an input still read one (the values are ignored)
+#
+#   python3 stream.py                  starts the parties, checks their
+#                                      results and reports evaluations/s
+#   python3 stream.py party_no fd pattern
+#                                      runs a party (started by the above),
+#                                      writing 'i result' lines to fd
+#
+# a party program can also import stream_protocol and call it with any
+# iterable of inputs, e.g. a generator reading from a sensor or a socket
+
+import concurrent.futures # ThreadPoolExecutor
+import collections # deque
+import os         # pipe, read, close, fdopen
+import selectors  # DefaultSelector
+import subprocess # Popen
+import sys        # argv
+import time       # perf_counter
+
+from circuit2_electric_boogaloo import ALL_PARTIES, CIRCUIT, DEGREE, N_PARTIES, PRIME, PRIVATE_VALUES, function
+from config  import MAX_TIME, PIPELINE_DEPTH, PKILL_PATTERN, STREAM_INPUTS, STREAM_LENGTH
+from log     import init_logging
+from network import Network
+from party2_electric_boogaloo import PLAN, bgw_protocol
+import recombination
+
+# ---------------------------------------------------------------------------
+
+def read_inputs(party_no):
+  # party's input stream - one value per line of the STREAM_INPUTS file for
+  # the party, or STREAM_LENGTH values counting up from its PRIVATE_VALUE
+  if STREAM_INPUTS is None:
+    for i in range(STREAM_LENGTH):
+      yield (PRIVATE_VALUES[party_no] + i) % PRIME
+  else:
+    with open(STREAM_INPUTS.format(party=party_no)) as file:
+      for line in file:
+        yield int(line)
+
+def stream_protocol(party_no, inputs, network, depth=PIPELINE_DEPTH):
+  # yield the result of the circuit for each value of inputs, in order
+  def evaluate(session, value):
+    init_logging(party_no)
+    result = bgw_protocol(party_no, value, network.session(session))
+    network.end_session(session)
+    return result
+
+  with concurrent.futures.ThreadPoolExecutor(max_workers=depth) as pool:
+    in_flight = collections.deque()
+    for session, value in enumerate(inputs, start=1):
+      if len(in_flight) == depth:
+        yield in_flight.popleft().result()
+      in_flight.append(pool.submit(evaluate, session, value))
+    while in_flight:
+      yield in_flight.popleft().result()
+
+# ---------------------------------------------------------------------------
+
+def main():
+  print(f'CIRCUIT {CIRCUIT}')
+  recombination.precompute([DEGREE + 1, 2*DEGREE + 1], N_PARTIES)
+  recombination.save()
+  PLAN.save()
+  expected = [function(dict(zip(ALL_PARTIES, values)))
+              for values in zip(*[read_inputs(p) for p in ALL_PARTIES])]
+
+  start = time.perf_counter()
+  parties, pipes = [], selectors.DefaultSelector()
+  for p in ALL_PARTIES:
+    read_fd, write_fd = os.pipe()
+    parties.append(subprocess.Popen(
+      ['python3', 'stream.py', str(p), str(write_fd), PKILL_PATTERN],
+      pass_fds=(write_fd,), stdout=subprocess.DEVNULL))
+    os.close(write_fd)
+    pipes.register(read_fd, selectors.EVENT_READ, p)
+
+  # read every party's results as they stream out, so none blocks on a full
+  # pipe, until all pipes close or none has produced anything for MAX_TIME
+  first = None
+  results = {p: [] for p in ALL_PARTIES}
+  partial = {p: b'' for p in ALL_PARTIES}   # unfinished line per party
+  stalled = False
+  while pipes.get_map():
+    events = pipes.select(timeout=MAX_TIME)
+    if not events:
+      stalled = True
+      break
+    for key, _ in events:
+      p = key.data
+      data = os.read(key.fd, 65536)
+      if not data:
+        pipes.unregister(key.fd)
+        os.close(key.fd)
+        continue
+      *lines, partial[p] = (partial[p] + data).split(b'\n')
+      results[p] += [int(line.split()[1]) for line in lines]
+      if first is None and results[1]:
+        first = time.perf_counter() - start
+  elapsed = time.perf_counter() - start
+
+  # terminate any parties still running after a stall
+  for key in list(pipes.get_map().values()):
+    os.close(key.fd)
+  for party in parties:
+    if party.poll() is None:
+      party.terminate()
+    party.wait()
+  if stalled:
+    print(f'No results for {MAX_TIME}s, stopped')
+
+  correct = sum(all(results[p][i:i+1] == [result] for p in ALL_PARTIES)
+                for (i, result) in enumerate(expected))
+  rate = (len(expected) - 1) / (elapsed - first) if first and len(expected) > 1 else 0
+  print(f'{correct}/{len(expected)} evaluations correct in {elapsed:.3f}s, first '
+        f'{first or 0:.3f}s (with start up), then {rate:.0f} evaluations/s '
+        f'({PIPELINE_DEPTH} in flight)')
+
+if __name__ == '__main__':
+  if len(sys.argv) > 1:
+    party_no = int(sys.argv[1])
+    result_pipe = os.fdopen(int(sys.argv[2]), 'w')
+    network = Network(party_no)
+    for i, result in enumerate(stream_protocol(party_no, read_inputs(party_no), network)):
+      result_pipe.write(f'{i} {result}\n')
+      result_pipe.flush()
+    result_pipe.close()
+  else:
+    main()